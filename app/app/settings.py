@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "core",
     "user",
     "recipe",
@@ -50,6 +52,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.middleware.MetricsMiddleware",
+    "core.middleware.RequestTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -94,6 +98,39 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+#
+# Use a shared backend (memcached, redis) in production so token evictions
+# reach every worker; with locmem a stale entry lives until TIMEOUT.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "auth_tokens": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "auth-tokens",
+        "TIMEOUT": 60,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+    "responses": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "responses",
+        "TIMEOUT": 60 * 60,
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
+}
+
+AUTH_TOKEN_CACHE = "auth_tokens"
+# rendered list responses, see recipe.mixins.ResponseCacheMixin
+RESPONSE_CACHE = "responses"
+
+# Lifetimes, in seconds, of signed tokens issued by user:token
+SIGNED_TOKEN_ACCESS_LIFETIME = 5 * 60
+SIGNED_TOKEN_REFRESH_LIFETIME = 14 * 24 * 60 * 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -134,15 +171,119 @@ STATIC_URL = "/static/static/"
 MEDIA_URL = "/static/media/"
 
 MEDIA_ROOT = "/vol/web/media/"
+
+# How core.views.MediaView hands files to the front proxy once access is
+# checked: None streams them from Django, "x-accel" answers with an
+# X-Accel-Redirect to MEDIA_ACCEL_PREFIX (an nginx "internal" location
+# aliased to MEDIA_ROOT) and "x-sendfile" with the file's path.
+MEDIA_SENDFILE = os.environ.get("MEDIA_SENDFILE") or None
+MEDIA_ACCEL_PREFIX = "/protected-media/"
 STATIC_ROOT = "/vol/web/static/"
 
+# Resized copies generated for every uploaded recipe image, bounding boxes
+# in pixels. Resizing runs in a pool of RECIPE_IMAGE_WORKERS processes, or
+# inline when RECIPE_IMAGE_VARIANTS_EAGER is set.
+RECIPE_IMAGE_VARIANTS = {
+    "thumb": (160, 160),
+    "medium": (640, 640),
+    "large": (1280, 1280),
+}
+RECIPE_IMAGE_WORKERS = 2
+RECIPE_IMAGE_VARIANTS_EAGER = False
+# Every image and variant is also stored as <name>.webp, served instead of
+# the original to clients that accept image/webp.
+RECIPE_IMAGE_WEBP_QUALITY = 80
+
+# Limits enforced while an image upload is streamed to disk. Formats are
+# Pillow format names, read from the image header.
+RECIPE_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 40_000_000
+RECIPE_IMAGE_FORMATS = ["JPEG", "PNG", "WEBP"]
+
+# Images are stored under a hash of their content and shared between
+# recipes. gc_images deletes files unreferenced for longer than this.
+RECIPE_IMAGE_GC_GRACE_HOURS = 24
+
+# Images resized on demand are kept under MEDIA_ROOT/cache/resized, least
+# recently served first out once the cache grows past its byte limit.
+RECIPE_IMAGE_RESIZE_MAX = 2048
+RECIPE_IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Recipes read from the database per round trip by the export endpoint
+RECIPE_EXPORT_CHUNK_SIZE = 500
+
+# Largest batch accepted by the bulk recipe endpoint
+RECIPE_BULK_MAX_ITEMS = 500
+
+# Render recipe lists and details from values() rows instead of model
+# instances, the output is the same
+RECIPE_VALUES_READ = True
+
+# Have Postgres build recipe list responses as JSON text, streamed to the
+# client as is. The keys and values are those of the serializer, the
+# spacing is Postgres'.
+RECIPE_LIST_SQL_JSON = False
+
+# Every worker process writes its request metrics to a file in this
+# directory at most every METRICS_FLUSH_INTERVAL seconds, /api/metrics
+# adds them up and folds the files of exited workers into totals.json.
+# Tests run with a temporary directory, see core.runner.
+METRICS_DIR = os.environ.get(
+    "METRICS_DIR", os.path.join(tempfile.gettempdir(), "app-metrics")
+)
+METRICS_FLUSH_INTERVAL = 5
+
+# Time authentication, database, serialization and rendering of every
+# request, reported in a Server-Timing header and a JSON line per request
+# on the core.access logger. The phases overlap, db time includes queries
+# run while serializing or rendering. Statements in the log are cut to
+# REQUEST_TIMING_SQL_CHARS characters.
+REQUEST_TIMING = os.environ.get("REQUEST_TIMING") == "1"
+REQUEST_TIMING_SQL_CHARS = 500
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {"message": {"format": "%(message)s"}},
+    "handlers": {
+        "access": {"class": "logging.StreamHandler", "formatter": "message"},
+    },
+    "loggers": {
+        "core.access": {
+            "handlers": ["access"],
+            "level": "INFO",
+            "propagate": False,
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+TEST_RUNNER = "core.runner.TestRunner"
+
 AUTH_USER_MODEL = "core.User"
 
-REST_FRAMEWORK = {"DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema"}
+REST_FRAMEWORK = {
+    "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_RENDERER_CLASSES": [
+        "core.renderers.ORJSONRenderer",
+        "core.renderers.MessagePackRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "core.parsers.ORJSONParser",
+        "core.parsers.MessagePackParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+    "TEST_REQUEST_RENDERER_CLASSES": [
+        "rest_framework.renderers.MultiPartRenderer",
+        "rest_framework.renderers.JSONRenderer",
+        "core.renderers.MessagePackRenderer",
+    ],
+}
 
 SPECTACULAR_SETTINGS = {"COMPONENT_SPLIT_REQUEST": True}
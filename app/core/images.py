@@ -0,0 +1,328 @@
+"""Image processing for recipe images"""
+
+import fcntl
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+# share of RECIPE_IMAGE_CACHE_MAX_BYTES a prune brings the cache down to
+CACHE_PRUNE_TARGET = 0.8
+
+_executor = None
+# bytes in each resize cache directory as far as this process knows
+_cache_sizes = {}
+
+
+def content_hash(file):
+    """
+    Return the SHA-256 hex digest of a file's content, reusing the digest
+    computed while the upload was streamed in when there is one.
+    """
+    digest = getattr(file, "content_hash", None)
+    if digest:
+        return digest
+
+    hasher = hashlib.sha256()
+    for chunk in file.chunks():
+        hasher.update(chunk)
+    file.seek(0)
+    return hasher.hexdigest()
+
+
+def variant_name(name, variant):
+    """Return the file name of a resized variant of an image"""
+    root, ext = os.path.splitext(name)
+    return f"{root}_{variant}{ext}"
+
+
+def _save_atomic(img, path, img_format, **params):
+    """Save an image so readers never see a partially written file"""
+    # unique per call, threads of one process share the pid
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            img.save(tmp, format=img_format, **params)
+        # mkstemp creates the file readable by its owner only
+        mode = settings.FILE_UPLOAD_PERMISSIONS
+        os.chmod(tmp_path, 0o644 if mode is None else mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def original_prefix(name):
+    """
+    Return the prefix shared by the original image a file derives from
+    and all of its derived files, whatever their extension.
+    """
+    root, _ = os.path.splitext(name)
+    for variant in settings.RECIPE_IMAGE_VARIANTS:
+        if root.endswith(f"_{variant}"):
+            root = root[: -len(variant) - 1]
+            break
+
+    return f"{root}."
+
+
+def webp_name(name):
+    """Return the file name of the WebP encoding of an image"""
+    root, _ = os.path.splitext(name)
+    return f"{root}.webp"
+
+
+def image_files(name):
+    """Return the names of an image and every file derived from it"""
+    names = [name]
+    for variant in settings.RECIPE_IMAGE_VARIANTS:
+        names.append(variant_name(name, variant))
+    return names + [webp_name(n) for n in names if webp_name(n) != n]
+
+
+def _save_webp(img, path, quality):
+    """Write the WebP sibling of the image at path unless it already is one"""
+    out = webp_name(path)
+    if out == path or os.path.exists(out):
+        return False
+
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA")
+    _save_atomic(img, out, "WEBP", quality=quality)
+    return True
+
+
+def encode_webp(path, quality):
+    """
+    Write the WebP sibling of the image at path.
+    Runs in a worker process. Returns whether a file was written.
+    """
+    out = webp_name(path)
+    if out == path or os.path.exists(out):
+        return False
+
+    with Image.open(path) as original:
+        img = ImageOps.exif_transpose(original)
+
+    return _save_webp(img, path, quality)
+
+
+def generate_variants(path, sizes, webp_quality):
+    """
+    Write a resized copy of the image at path for each variant size, and a
+    WebP encoding of the original and of every variant.
+    Runs in a worker process, so it must not touch Django models.
+    Returns the names of the variants now on disk.
+    """
+    with Image.open(path) as original:
+        img_format = original.format
+        img = ImageOps.exif_transpose(original)
+
+    _save_webp(img, path, webp_quality)
+
+    # shrink in place from the largest size down, each step starts from
+    # the previous, already smaller, image
+    for variant, size in sorted(
+        sizes.items(), key=lambda item: item[1], reverse=True
+    ):
+        out = variant_name(path, variant)
+        if os.path.exists(out):
+            continue
+        img.thumbnail(size, Image.LANCZOS)
+        _save_atomic(img, out, img_format, quality=85)
+        _save_webp(img, out, webp_quality)
+
+    return list(sizes)
+
+
+def resized_cache_dir():
+    """Return the directory holding on-demand resized images"""
+    return os.path.join(settings.MEDIA_ROOT, "cache", "resized")
+
+
+def resized_path(name, width, height, fit):
+    """Return the cache path of an image resized to width x height"""
+    key = hashlib.sha256(f"{name}:{width}x{height}:{fit}".encode())
+    digest = key.hexdigest()
+    _, ext = os.path.splitext(name)
+    return os.path.join(resized_cache_dir(), digest[:2], f"{digest}{ext}")
+
+
+def _resize(path, out, width, height, fit):
+    """Write a copy of the image at path fitted into width x height"""
+    with Image.open(path) as original:
+        img_format = original.format
+        img = ImageOps.exif_transpose(original)
+
+    if fit == "cover":
+        img = ImageOps.fit(img, (width, height), Image.LANCZOS)
+    else:
+        img.thumbnail((width, height), Image.LANCZOS)
+    _save_atomic(img, out, img_format, quality=85)
+
+
+def _prune_resized_cache(keep):
+    """
+    Evict the least recently used resized images until the cache is back
+    under CACHE_PRUNE_TARGET of RECIPE_IMAGE_CACHE_MAX_BYTES, and return
+    its remaining size. Hits refresh the mtime of a file, so the oldest
+    mtime is the least recently served one.
+    """
+    entries = []
+    total = 0
+    for root, _, files in os.walk(resized_cache_dir()):
+        for filename in files:
+            if filename.endswith((".lock", ".tmp")):
+                continue
+            path = os.path.join(root, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    limit = settings.RECIPE_IMAGE_CACHE_MAX_BYTES * CACHE_PRUNE_TARGET
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+    return total
+
+
+def _track_resized(out):
+    """
+    Add a new entry to the size of the cache, pruning it once the size
+    passes RECIPE_IMAGE_CACHE_MAX_BYTES. The size is scanned once per
+    process and then only counts its own writes, so the cache can run over
+    by what other workers add until this one next prunes. Pruning goes
+    below the limit, which keeps the scans to one every few misses.
+    """
+    cache_dir = resized_cache_dir()
+    size = _cache_sizes.get(cache_dir)
+    if size is not None:
+        size += os.path.getsize(out)
+    if size is None or size > settings.RECIPE_IMAGE_CACHE_MAX_BYTES:
+        size = _prune_resized_cache(keep=out)
+    _cache_sizes[cache_dir] = size
+
+
+def get_resized(path, name, width, height, fit):
+    """
+    Return a resized copy of an image opened for reading, creating it on a
+    miss. Hits only touch the file, they never load Pillow. Concurrent
+    misses for the same size take a lock on the entry, so one request
+    resizes while the others wait and then serve its result. An open file
+    outlives its eviction, so a concurrent prune cannot fail the response.
+    """
+    out = resized_path(name, width, height, fit)
+    try:
+        file = open(out, "rb")
+    except FileNotFoundError:
+        pass
+    else:
+        os.utime(file.fileno())
+        return file
+
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    lock_path = f"{out}.lock"
+    with open(lock_path, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            try:
+                file = open(out, "rb")
+            except FileNotFoundError:
+                _resize(path, out, width, height, fit)
+                file = open(out, "rb")
+                _track_resized(out)
+        finally:
+            # waiters still hold the old inode and will find the file
+            if os.path.exists(lock_path):
+                os.remove(lock_path)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+    return file
+
+
+def get_executor():
+    """Return the process pool shared by this worker"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.RECIPE_IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    return _executor
+
+
+def _store_variants(recipe, name, variants):
+    """Record finished variants if the recipe still has the same image"""
+    from core.models import Recipe, User
+
+    updated = Recipe.objects.filter(pk=recipe.pk, image=name).update(
+        image_variants={v: variant_name(name, v) for v in variants},
+        updated_at=timezone.now(),
+    )
+    if updated:
+        User.objects.bump_collection_version(recipe.user_id)
+
+
+def _variants_done(recipe, name, future):
+    """Store the result of a background resize job"""
+    try:
+        _store_variants(recipe, name, future.result())
+    except Exception:
+        logger.exception("Generating variants for %s failed", name)
+    finally:
+        # runs on the executor's thread, which has its own connection
+        connections.close_all()
+
+
+def queue_recipe_variants(recipe):
+    """
+    Generate the RECIPE_IMAGE_VARIANTS and WebP encodings of a recipe's
+    image.
+    Resizing runs in a process pool so web workers never block on
+    decoding, submitted once the current transaction commits. With
+    RECIPE_IMAGE_VARIANTS_EAGER it runs inline instead.
+    """
+    if not recipe.image:
+        return
+
+    name = recipe.image.name
+    path = recipe.image.path
+    sizes = settings.RECIPE_IMAGE_VARIANTS
+    quality = settings.RECIPE_IMAGE_WEBP_QUALITY
+
+    if settings.RECIPE_IMAGE_VARIANTS_EAGER:
+        variants = generate_variants(path, sizes, quality)
+        _store_variants(recipe, name, variants)
+        return
+
+    def submit():
+        future = get_executor().submit(generate_variants, path, sizes, quality)
+        future.add_done_callback(partial(_variants_done, recipe, name))
+
+    # the worker must see the committed image, and nothing if rolled back
+    transaction.on_commit(submit)
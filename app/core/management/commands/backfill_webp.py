@@ -0,0 +1,59 @@
+"""Django command to pre-encode WebP copies of existing recipe images"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.images import encode_webp
+from core.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Write the missing WebP encodings of uploaded recipe images."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of encoder processes, 1 encodes inline.",
+        )
+        parser.add_argument(
+            "--quality",
+            type=int,
+            default=settings.RECIPE_IMAGE_WEBP_QUALITY,
+        )
+
+    def get_paths(self):
+        """Yield the path of every recipe image and stored variant"""
+        storage = Recipe._meta.get_field("image").storage
+        images = (
+            Recipe.objects.exclude(image="")
+            .exclude(image__isnull=True)
+            .values_list("image", "image_variants")
+        )
+        for name, variants in images.iterator():
+            yield storage.path(name)
+            for variant in variants.values():
+                yield storage.path(variant)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        encode = partial(encode_webp, quality=options["quality"])
+        paths = [path for path in self.get_paths() if os.path.exists(path)]
+        self.stdout.write(f"Checking {len(paths)} images...")
+
+        if options["workers"] > 1:
+            with ProcessPoolExecutor(
+                max_workers=options["workers"],
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as executor:
+                written = sum(executor.map(encode, paths, chunksize=16))
+        else:
+            written = sum(map(encode, paths))
+
+        self.stdout.write(self.style.SUCCESS(f"Encoded {written} images"))
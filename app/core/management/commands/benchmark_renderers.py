@@ -0,0 +1,102 @@
+"""Django command to compare the API renderers"""
+
+import time
+from collections import OrderedDict
+
+from django.core.management.base import BaseCommand
+
+from rest_framework.renderers import JSONRenderer
+
+from core.renderers import MessagePackRenderer, ORJSONRenderer
+
+
+RENDERERS = {
+    "json": JSONRenderer,
+    "orjson": ORJSONRenderer,
+    "msgpack": MessagePackRenderer,
+}
+
+
+def sample_recipe(i, items):
+    """Return a recipe as the list serializer represents it"""
+    image = f"http://localhost:8000/media/uploads/recipe/{i:02x}/{i:064x}"
+    return OrderedDict(
+        [
+            ("id", i),
+            ("title", f"Recipe number {i}"),
+            ("time_minutes", i % 120),
+            ("price", f"{i % 5000 / 100:.2f}"),
+            ("link", f"https://example.com/recipes/{i}"),
+            (
+                "tags",
+                [
+                    OrderedDict([("id", n), ("name", f"Tag {n}")])
+                    for n in range(items)
+                ],
+            ),
+            (
+                "ingredients",
+                [
+                    OrderedDict([("id", n), ("name", f"Ingredient {n}")])
+                    for n in range(items)
+                ],
+            ),
+            ("image", f"{image}.jpg"),
+            (
+                "image_variants",
+                {
+                    "thumb": f"{image}_thumb.jpg",
+                    "medium": f"{image}_medium.jpg",
+                },
+            ),
+        ]
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Time rendering pages of recipes with each renderer and compare "
+        "the payload sizes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", nargs="+", type=int, default=[100, 500, 10000]
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Runs per renderer."
+        )
+        parser.add_argument(
+            "--items",
+            type=int,
+            default=3,
+            help="Tags and ingredients of each recipe.",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        for size in options["sizes"]:
+            data = OrderedDict(
+                [
+                    ("next", "http://localhost:8000/api/recipe/recipes/"),
+                    ("previous", None),
+                    (
+                        "results",
+                        [
+                            sample_recipe(i, options["items"])
+                            for i in range(size)
+                        ],
+                    ),
+                ]
+            )
+            for name, renderer_class in RENDERERS.items():
+                renderer = renderer_class()
+                timings = []
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    content = renderer.render(data)
+                    timings.append(time.perf_counter() - started)
+                self.stdout.write(
+                    f"{size} recipes, {name}: "
+                    f"{min(timings) * 1000:.2f} ms, {len(content)} bytes"
+                )
@@ -0,0 +1,57 @@
+"""Django command to delete recipe images no recipe refers to"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.images import image_files
+from core.models import ImageBlob, Recipe
+
+
+class Command(BaseCommand):
+    help = "Delete image files that have been unreferenced for a while."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-hours",
+            type=float,
+            default=settings.RECIPE_IMAGE_GC_GRACE_HOURS,
+            help="Keep unreferenced images for this long before deleting.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be deleted.",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        storage = Recipe._meta.get_field("image").storage
+        cutoff = timezone.now() - timedelta(hours=options["grace_hours"])
+        candidates = ImageBlob.objects.filter(
+            refcount=0, unreferenced_at__lt=cutoff
+        ).values_list("pk", flat=True)
+
+        deleted = 0
+        for pk in candidates.iterator():
+            with transaction.atomic():
+                # uploads reusing the file lock the row and restart the
+                # grace period, so recheck both under the lock
+                blob = (
+                    ImageBlob.objects.select_for_update(skip_locked=True)
+                    .filter(pk=pk, refcount=0, unreferenced_at__lt=cutoff)
+                    .first()
+                )
+                if blob is None:
+                    continue
+                if not options["dry_run"]:
+                    for name in image_files(blob.name):
+                        storage.delete(name)
+                    blob.delete()
+            deleted += 1
+
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {deleted} images"))
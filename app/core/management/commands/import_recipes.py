@@ -0,0 +1,217 @@
+"""Django command to bulk import recipes from JSONL or CSV"""
+
+import csv
+import json
+import os
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DataError, transaction
+
+from core.models import ImportCheckpoint, Ingredient, Recipe, Tag
+
+
+RECIPE_FIELDS = ["title", "description", "link"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Import recipes for a user from a JSONL or CSV file, in batches. "
+        "Rows use the fields of the export endpoint. Progress is saved in "
+        "the transaction of every batch and picked up on restart."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--user", required=True, help="Email of the owning user."
+        )
+        parser.add_argument(
+            "--format",
+            choices=["jsonl", "csv"],
+            help="Input format, guessed from the file extension by default.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--checkpoint",
+            help="Checkpoint name, the absolute path by default.",
+        )
+
+    def read_rows(self, f, input_format):
+        """Yield the input rows as dicts"""
+        if input_format == "csv":
+            yield from csv.DictReader(f)
+            return
+
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+    def parse_names(self, value):
+        """Return the names of tags or ingredients given in a row"""
+        if not value:
+            return []
+        if isinstance(value, str):
+            value = value.split(";")
+
+        names = []
+        for item in value:
+            name = item["name"] if isinstance(item, dict) else item
+            name = name.strip()
+            if name and name not in names:
+                names.append(name)
+
+        return names
+
+    def parse_row(self, row, line):
+        """Return the recipe fields, tag names and ingredient names"""
+        price = row.get("price")
+        try:
+            fields = {
+                "time_minutes": int(row["time_minutes"]),
+                "price": (
+                    None if price in (None, "") else Decimal(str(price))
+                ),
+            }
+        except (KeyError, TypeError, ValueError, InvalidOperation) as exc:
+            raise CommandError(f"Row {line}: invalid recipe ({exc!r})")
+
+        for field in RECIPE_FIELDS:
+            fields[field] = row.get(field) or ""
+        tags = self.parse_names(row.get("tags"))
+        ingredients = self.parse_names(row.get("ingredients"))
+
+        # values the columns cannot hold would fail the whole batch
+        values = [(Recipe, name, value) for name, value in fields.items()]
+        values += [(Tag, "name", name) for name in tags]
+        values += [(Ingredient, "name", name) for name in ingredients]
+        for model, name, value in values:
+            try:
+                model._meta.get_field(name).clean(value, None)
+            except ValidationError as exc:
+                raise CommandError(
+                    f"Row {line}: invalid {name} ({'; '.join(exc.messages)})"
+                )
+
+        return fields, tags, ingredients
+
+    def load_names(self, model, user):
+        """Return a name to id map of the user's existing objects"""
+        ids = {}
+        existing = model.objects.filter(user=user).order_by("id")
+        for name, pk in existing.values_list("name", "id").iterator():
+            ids.setdefault(name, pk)
+
+        return ids
+
+    def resolve_names(self, model, user, ids, names):
+        """Create the objects missing from ids, in one insert"""
+        missing = [name for name in dict.fromkeys(names) if name not in ids]
+        created = model.objects.bulk_create(
+            [model(user=user, name=name) for name in missing]
+        )
+        for obj in created:
+            ids[obj.name] = obj.pk
+
+    def import_batch(self, user, batch, tag_ids, ingredient_ids):
+        """Insert a batch of parsed rows and their links"""
+        self.resolve_names(
+            Tag, user, tag_ids, [n for _, tags, _ in batch for n in tags]
+        )
+        self.resolve_names(
+            Ingredient,
+            user,
+            ingredient_ids,
+            [n for _, _, ingredients in batch for n in ingredients],
+        )
+        recipes = Recipe.objects.bulk_create(
+            [Recipe(user=user, **fields) for fields, _, _ in batch]
+        )
+
+        tag_links = []
+        ingredient_links = []
+        for recipe, (_, tags, ingredients) in zip(recipes, batch):
+            tag_links += [
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_ids[n])
+                for n in tags
+            ]
+            ingredient_links += [
+                Recipe.ingredients.through(
+                    recipe_id=recipe.pk, ingredient_id=ingredient_ids[n]
+                )
+                for n in ingredients
+            ]
+        Recipe.tags.through.objects.bulk_create(tag_links)
+        Recipe.ingredients.through.objects.bulk_create(ingredient_links)
+
+    def read_checkpoint(self, name):
+        """Return the number of rows imported by earlier runs"""
+        rows = ImportCheckpoint.objects.filter(name=name).values_list(
+            "rows", flat=True
+        )
+        return rows.first() or 0
+
+    def write_checkpoint(self, name, done):
+        """Record the number of rows imported so far"""
+        ImportCheckpoint.objects.update_or_create(
+            name=name, defaults={"rows": done}
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        path = options["path"]
+        input_format = options["format"] or (
+            "csv" if path.lower().endswith(".csv") else "jsonl"
+        )
+        checkpoint = options["checkpoint"] or os.path.abspath(path)
+        batch_size = options["batch_size"]
+
+        User = get_user_model()
+        try:
+            user = User.objects.get(email=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with email {options['user']}")
+
+        tag_ids = self.load_names(Tag, user)
+        ingredient_ids = self.load_names(Ingredient, user)
+
+        done = skipped = self.read_checkpoint(checkpoint)
+        if skipped:
+            self.stdout.write(f"Resuming after {skipped} rows")
+
+        started = time.monotonic()
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = islice(self.read_rows(f, input_format), skipped, None)
+            while True:
+                batch = [
+                    self.parse_row(row, done + i + 1)
+                    for i, row in enumerate(islice(rows, batch_size))
+                ]
+                if not batch:
+                    break
+
+                try:
+                    with transaction.atomic():
+                        self.import_batch(
+                            user, batch, tag_ids, ingredient_ids
+                        )
+                        # bulk inserts skip the signals that invalidate caches
+                        User.objects.bump_collection_version(user.pk)
+                        self.write_checkpoint(checkpoint, done + len(batch))
+                except DataError as exc:
+                    raise CommandError(
+                        f"Rows {done + 1}-{done + len(batch)}: {exc}"
+                    )
+                done += len(batch)
+
+                elapsed = time.monotonic() - started
+                rate = (done - skipped) / elapsed if elapsed else 0
+                self.stdout.write(f"{done} rows, {rate:.0f} rows/s")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Imported {done - skipped} recipes")
+        )
@@ -0,0 +1,325 @@
+"""Request metrics shared between worker processes"""
+
+import fcntl
+import json
+import math
+import os
+import re
+import secrets
+import tempfile
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+METRICS = {
+    "http_requests_total": ("counter", "Requests served."),
+    "http_request_duration_seconds": (
+        "histogram",
+        "Time spent handling requests.",
+    ),
+    "http_response_size_bytes": ("histogram", "Size of response bodies."),
+    "db_queries_total": ("counter", "Database queries run by requests."),
+    "db_query_duration_seconds_total": (
+        "counter",
+        "Time spent in database queries by requests.",
+    ),
+}
+
+# snapshot file of a running or exited process, and the merged totals
+PROCESS_FILE = re.compile(r"metrics-(?P<pid>\d+)-\w+\.json")
+TOTALS_FILE = "totals.json"
+
+
+def read_snapshot(path):
+    """Return the snapshot saved at path, None if it is gone or partial"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_snapshot(path, data):
+    """Replace the file at path with data, atomically"""
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), suffix=".tmp"
+    )
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def to_snapshot(counters, histograms):
+    """Return counters and histograms as JSON compatible data"""
+    return {
+        "counters": [
+            [name, list(labels), value]
+            for (name, labels), value in counters.items()
+        ],
+        "histograms": [
+            [name, list(labels), histogram]
+            for (name, labels), histogram in histograms.items()
+        ],
+    }
+
+
+def add_snapshot(counters, histograms, data):
+    """Add the metrics of a snapshot to running totals"""
+    for name, labels, value in data["counters"]:
+        counters[name, tuple(map(tuple, labels))] += value
+    for name, labels, histogram in data["histograms"]:
+        key = name, tuple(map(tuple, labels))
+        total = histograms.setdefault(
+            key,
+            {
+                "buckets": histogram["buckets"],
+                "counts": [0] * len(histogram["buckets"]),
+                "sum": 0.0,
+                "count": 0,
+            },
+        )
+        for i, count in enumerate(histogram["counts"]):
+            total["counts"][i] += count
+        total["sum"] += histogram["sum"]
+        total["count"] += histogram["count"]
+
+
+def is_running(pid):
+    """Return whether a process with this pid exists"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsStore:
+    """
+    Counters and histograms of one process, shared through files.
+    Updates only touch in-process dicts and take no locks, a worker serves
+    one request at a time. Every METRICS_FLUSH_INTERVAL seconds the
+    process writes a snapshot to its own file under METRICS_DIR, named
+    after its pid and a random token so a reused pid never overwrites the
+    file of an exited worker. collect() adds up the files of every
+    process, so the totals cover all workers whichever one answers the
+    scrape, after folding the files of exited ones into a totals file.
+    Counters keep growing across worker restarts and the directory does
+    not.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.token = secrets.token_hex(4)
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.flushed_at = time.monotonic()
+
+    def _check_fork(self):
+        # a forked worker must not count on top of its parent's file
+        if os.getpid() != self.pid:
+            self.reset()
+
+    def inc(self, name, labels, value=1):
+        """Add value to a counter"""
+        self._check_fork()
+        self.counters[name, labels] += value
+
+    def observe(self, name, labels, value, buckets):
+        """Record a value in a histogram"""
+        self._check_fork()
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[name, labels] = {
+                "buckets": list(buckets),
+                "counts": [0] * len(buckets),
+                "sum": 0.0,
+                "count": 0,
+            }
+        for i, bound in enumerate(histogram["buckets"]):
+            if value <= bound:
+                histogram["counts"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+    @property
+    def path(self):
+        return os.path.join(
+            settings.METRICS_DIR, f"metrics-{self.pid}-{self.token}.json"
+        )
+
+    def snapshot(self):
+        """Return the metrics of this process as JSON compatible data"""
+        return to_snapshot(self.counters, self.histograms)
+
+    def flush(self, force=False):
+        """Write the snapshot of this process if it is due"""
+        self._check_fork()
+        now = time.monotonic()
+        interval = settings.METRICS_FLUSH_INTERVAL
+        if not force and now - self.flushed_at < interval:
+            return
+
+        self.flushed_at = now
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        write_snapshot(self.path, self.snapshot())
+
+    def merge_exited(self):
+        """
+        Fold the files of exited processes into the totals file and remove
+        them. The totals list the files they include until those are gone,
+        so a crash between the two steps cannot count a file twice.
+        """
+        directory = settings.METRICS_DIR
+        totals_path = os.path.join(directory, TOTALS_FILE)
+        totals = read_snapshot(totals_path) or to_snapshot({}, {})
+        merged = [
+            name
+            for name in totals.get("merged", [])
+            if os.path.exists(os.path.join(directory, name))
+        ]
+        exited = []
+        for entry in os.scandir(directory):
+            match = PROCESS_FILE.fullmatch(entry.name)
+            if (
+                match
+                and entry.name not in merged
+                and not is_running(int(match["pid"]))
+            ):
+                exited.append(entry)
+
+        if exited:
+            counters = defaultdict(float)
+            histograms = {}
+            add_snapshot(counters, histograms, totals)
+            for entry in exited:
+                data = read_snapshot(entry.path)
+                if data is not None:
+                    add_snapshot(counters, histograms, data)
+                merged.append(entry.name)
+            totals = to_snapshot(counters, histograms)
+            write_snapshot(totals_path, {**totals, "merged": merged})
+
+        for name in merged:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+    def collect(self):
+        """Return the counters and histograms added up over all processes"""
+        self.flush(force=True)
+        counters = defaultdict(float)
+        histograms = {}
+        lock_path = os.path.join(settings.METRICS_DIR, "totals.lock")
+        with open(lock_path, "w") as lock:
+            # one scrape at a time merges, and none reads half a merge
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.merge_exited()
+            for entry in os.scandir(settings.METRICS_DIR):
+                if not entry.name.endswith(".json"):
+                    continue
+                data = read_snapshot(entry.path)
+                if data is not None:
+                    add_snapshot(counters, histograms, data)
+
+        return counters, histograms
+
+
+store = MetricsStore()
+
+
+def escape(value):
+    """Escape a label value for the text format"""
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+def format_labels(labels, **extra):
+    """Return the {key="value",...} part of a sample"""
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+
+    return "{%s}" % ",".join(
+        f'{key}="{escape(value)}"' for key, value in pairs
+    )
+
+
+def format_value(value):
+    """Return a sample value as the text format writes it"""
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+
+    return repr(float(value))
+
+
+def render_metrics(counters, histograms):
+    """Render collected metrics in the Prometheus text format"""
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for (key, labels), value in sorted(counters.items()):
+            if key == name:
+                labels = format_labels(labels)
+                lines.append(f"{name}{labels} {format_value(value)}")
+        for (key, labels), histogram in sorted(histograms.items()):
+            if key != name:
+                continue
+            bounds = [*histogram["buckets"], math.inf]
+            counts = [*histogram["counts"], histogram["count"]]
+            for bound, count in zip(bounds, counts):
+                bucket_labels = format_labels(labels, le=format_value(bound))
+                lines.append(f"{name}_bucket{bucket_labels} {count}")
+            labels = format_labels(labels)
+            total = format_value(histogram["sum"])
+            lines.append(f"{name}_sum{labels} {total}")
+            lines.append(f"{name}_count{labels} {histogram['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+def record_request(labels, method, status, duration, queries, db_time):
+    """Record a finished request, labels are the view and action"""
+    store.inc(
+        "http_requests_total",
+        (*labels, ("method", method), ("status", str(status))),
+    )
+    store.observe(
+        "http_request_duration_seconds", labels, duration, LATENCY_BUCKETS
+    )
+    store.inc("db_queries_total", labels, queries)
+    store.inc("db_query_duration_seconds_total", labels, db_time)
+    store.flush()
+
+
+def record_response_size(labels, size):
+    """Record the size of a response body"""
+    store.observe("http_response_size_bytes", labels, size, SIZE_BUCKETS)
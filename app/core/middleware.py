@@ -0,0 +1,190 @@
+"""Middleware for the API"""
+
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from core import metrics
+from core.timing import RequestTimer
+
+
+access_logger = logging.getLogger("core.access")
+
+
+class QueryTimer:
+    """Execute wrapper counting the queries of a request and their time"""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+
+def view_labels(request):
+    """
+    Return the view and action labels of a request, the class and action
+    names for viewsets, e.g. RecipeViewSet and list or upload_image, and
+    the class and method for other views.
+    """
+    method = request.method.lower()
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return (("view", "unmatched"), ("action", method))
+
+    func = match.func
+    view = getattr(func, "cls", func)
+    actions = getattr(func, "actions", None) or {}
+    return (
+        ("view", getattr(view, "__name__", "unknown")),
+        ("action", actions.get(method, method)),
+    )
+
+
+class MetricsMiddleware:
+    """
+    Record request counts, latency, database queries and time and response
+    sizes per view and action in core.metrics.
+    Sizes of streamed responses without a Content-Length are recorded
+    once the body has been sent, queries the stream runs are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        labels = view_labels(request)
+        metrics.record_request(
+            labels,
+            request.method,
+            response.status_code,
+            duration,
+            timer.queries,
+            timer.seconds,
+        )
+        if response.has_header("Content-Length"):
+            metrics.record_response_size(
+                labels, int(response["Content-Length"])
+            )
+        elif response.streaming:
+            response.streaming_content = self.count_streamed(
+                response.streaming_content, labels
+            )
+        else:
+            metrics.record_response_size(labels, len(response.content))
+
+        return response
+
+    def count_streamed(self, content, labels):
+        """Pass a streamed body through, then record its size"""
+        size = 0
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            metrics.record_response_size(labels, size)
+
+
+class RequestTimingMiddleware:
+    """
+    Opt-in timing of the phases of each request, with REQUEST_TIMING.
+    Authentication, serialization and rendering are timed where they
+    happen, see core.timing, database time is taken with an execute
+    wrapper. Phases overlap: querysets are evaluated while serializing,
+    so db time is also counted in serialize and render, and the nested
+    relations of serialize.nested are part of serialize. The durations
+    are sent in a Server-Timing header and logged as one JSON line per
+    request to the core.access logger, along with the number of queries
+    and the slowest statement.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REQUEST_TIMING:
+            return self.get_response(request)
+
+        timer = request.timer = RequestTimer()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        total = time.perf_counter() - timer.started
+
+        response["Server-Timing"] = self.server_timing(timer, total)
+        access_logger.info(self.access_line(request, response, timer, total))
+        return response
+
+    def process_template_response(self, request, response):
+        """Time rendering, which runs right after this hook"""
+        timer = getattr(request, "timer", None)
+        if timer is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                timer.add("render", time.perf_counter() - started)
+
+            response.add_post_render_callback(rendered)
+
+        return response
+
+    def server_timing(self, timer, total):
+        """Return the Server-Timing header value"""
+        entries = [
+            f"{phase};dur={seconds * 1000:.2f}"
+            for phase, seconds in timer.phases.items()
+        ]
+        entries.append(
+            f"db;dur={timer.db_seconds * 1000:.2f};"
+            f'desc="{timer.queries} queries"'
+        )
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+    def access_line(self, request, response, timer, total):
+        """Return the JSON access log line of a request"""
+        labels = dict(view_labels(request))
+        slowest = None
+        if timer.slowest_sql is not None:
+            slowest = {
+                "sql": timer.slowest_sql[: settings.REQUEST_TIMING_SQL_CHARS],
+                "ms": round(timer.slowest_seconds * 1000, 2),
+            }
+
+        return json.dumps(
+            {
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "view": labels["view"],
+                "action": labels["action"],
+                "ms": round(total * 1000, 2),
+                "phases": {
+                    phase: round(seconds * 1000, 2)
+                    for phase, seconds in timer.phases.items()
+                },
+                "db_ms": round(timer.db_seconds * 1000, 2),
+                "queries": timer.queries,
+                "slowest_query": slowest,
+            }
+        )
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Composite (target, recipe) indexes on the M2M through tables.
+    Django already creates a unique (recipe_id, target_id) index, this adds
+    the reverse direction used when filtering recipes by tag or ingredient.
+    """
+
+    dependencies = [
+        ('core', '0007_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                'CREATE INDEX core_recipe_tags_tag_recipe_idx '
+                'ON core_recipe_tags (tag_id, recipe_id);'
+            ),
+            reverse_sql='DROP INDEX core_recipe_tags_tag_recipe_idx;',
+        ),
+        migrations.RunSQL(
+            sql=(
+                'CREATE INDEX core_recipe_ingredients_ingredient_recipe_idx '
+                'ON core_recipe_ingredients (ingredient_id, recipe_id);'
+            ),
+            reverse_sql=(
+                'DROP INDEX core_recipe_ingredients_ingredient_recipe_idx;'
+            ),
+        ),
+    ]
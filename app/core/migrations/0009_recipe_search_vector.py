@@ -0,0 +1,59 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:00
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+SEARCH_TRIGGER_SQL = [
+    """
+CREATE FUNCTION core_recipe_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(
+            to_tsvector('pg_catalog.english', coalesce(NEW.title, '')), 'A'
+        ) ||
+        setweight(
+            to_tsvector('pg_catalog.english', coalesce(NEW.description, '')),
+            'B'
+        );
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+""",
+    """
+CREATE TRIGGER core_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE ON core_recipe
+    FOR EACH ROW EXECUTE PROCEDURE core_recipe_search_vector_update();
+""",
+    # backfill existing rows through the trigger
+    "UPDATE core_recipe SET title = title;",
+]
+
+REVERSE_SEARCH_TRIGGER_SQL = [
+    "DROP TRIGGER IF EXISTS core_recipe_search_vector_trigger ON core_recipe;",
+    "DROP FUNCTION IF EXISTS core_recipe_search_vector_update();",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_recipe_through_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_search_idx'),
+        ),
+        migrations.RunSQL(
+            sql=SEARCH_TRIGGER_SQL,
+            reverse_sql=REVERSE_SEARCH_TRIGGER_SQL,
+        ),
+    ]
@@ -1,9 +1,12 @@
 """Database models"""
 
-import uuid
 import os
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.functions import Greatest
+from django.utils import timezone
 
 from django.contrib.auth.base_user import (
     AbstractBaseUser,
@@ -13,13 +16,17 @@ from django.contrib.auth.base_user import (
 from django.contrib.auth.models import PermissionsMixin
 from django.conf import settings
 
+from core.storage import recipe_image_storage
+
 
 def recipe_file_path(instance, filename):
-    """Generate filepath for new recipe image"""
-    ext = os.path.splitext(filename)[1]
-    filename = f"{uuid.uuid4()}{ext}"
+    """
+    Generate filepath for new recipe image.
+    The storage replaces the file name with a hash of the content.
+    """
+    ext = os.path.splitext(filename)[1].lower()
 
-    return os.path.join("uploads", "recipe", filename)
+    return os.path.join("uploads", "recipe", f"image{ext}")
 
 
 class UserManager(BaseUserManager):
@@ -45,6 +52,13 @@ class UserManager(BaseUserManager):
 
         return user
 
+    def bump_collection_version(self, user_id):
+        """Mark a user's recipes, tags or ingredients as changed"""
+        self.filter(pk=user_id).update(
+            collection_version=models.F("collection_version") + 1,
+            collection_modified_at=timezone.now(),
+        )
+
 
 class User(AbstractBaseUser, PermissionsMixin):
     """User in the system"""
@@ -53,6 +67,9 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # bumped on every change to the user's recipes, tags or ingredients
+    collection_version = models.PositiveBigIntegerField(default=0)
+    collection_modified_at = models.DateTimeField(default=timezone.now)
 
     objects = UserManager()
 
@@ -75,11 +92,94 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)
     tags = models.ManyToManyField("Tag")
     ingredients = models.ManyToManyField("Ingredient")
-    image = models.ImageField(null=True, upload_to=recipe_file_path)
+    image = models.ImageField(
+        null=True,
+        upload_to=recipe_file_path,
+        storage=recipe_image_storage,
+        # media access checks look recipes up by image name prefix
+        db_index=True,
+    )
+    # variant name -> file name, filled in by core.images once resized
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    # maintained by a database trigger from title and description
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-id"], name="recipe_user_id_idx"),
+            GinIndex(fields=["search_vector"], name="recipe_search_idx"),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # lets core.signals tell when the image was replaced
+        instance._loaded_image = instance.__dict__.get("image")
+        return instance
+
+
+class ImageBlobManager(models.Manager):
+    """Manager for image blobs"""
+
+    def incref(self, name):
+        """Record a new reference to a stored image"""
+        self.bulk_create([self.model(name=name)], ignore_conflicts=True)
+        self.filter(name=name).update(
+            refcount=models.F("refcount") + 1, unreferenced_at=None
+        )
+
+    def decref(self, name, count=1):
+        """Drop count references to a stored image"""
+        self.filter(name=name, refcount__gt=0).update(
+            refcount=Greatest(models.F("refcount") - count, 0)
+        )
+        self.filter(name=name, refcount=0).update(
+            unreferenced_at=timezone.now()
+        )
+
+
+class ImageBlob(models.Model):
+    """
+    A content-addressed image file and the number of recipes using it.
+    Unreferenced blobs are deleted by the gc_images command.
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.PositiveIntegerField(default=0)
+    unreferenced_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ImageBlobManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["unreferenced_at"],
+                name="imageblob_unreferenced_idx",
+                condition=models.Q(refcount=0),
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class ImportCheckpoint(models.Model):
+    """
+    The number of rows of an input the import_recipes command has loaded.
+    It is saved in the transaction of each batch, so a crash can neither
+    lose a batch nor import it twice.
+    """
+
+    name = models.CharField(max_length=1024, unique=True)
+    rows = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
 
 class Tag(models.Model):
     """Tag for filtering recipes"""
@@ -88,6 +188,14 @@ class Tag(models.Model):
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE
     )
     name = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "-name", "-id"], name="tag_user_name_idx"
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -100,6 +208,15 @@ class Ingredient(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "-name", "-id"],
+                name="ingredient_user_name_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
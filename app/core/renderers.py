@@ -0,0 +1,60 @@
+"""Renderers used by the API by default"""
+
+from decimal import Decimal
+
+import msgpack
+import orjson
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+
+class JSONEncoder(encoders.JSONEncoder):
+    """DRF's encoder, with decimals as text as DecimalField renders them"""
+
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return str(obj)
+
+        return super().default(obj)
+
+
+# converts what the encoders cannot, lazy strings, decimals, dates, ...
+encode_default = JSONEncoder().default
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Render JSON with orjson.
+    Serializers hand over plain dicts, lists, strings and numbers, which
+    orjson encodes natively, so encode_default is only reached for the
+    odd lazy string or decimal. Indented output keeps the stdlib encoder,
+    orjson only indents by two spaces.
+    """
+
+    encoder_class = JSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return orjson.dumps(
+            data, default=encode_default, option=orjson.OPT_NON_STR_KEYS
+        )
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Render MessagePack for internal services"""
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
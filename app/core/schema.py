@@ -0,0 +1,30 @@
+"""OpenAPI schema extensions for the core app"""
+
+from drf_spectacular.extensions import OpenApiAuthenticationExtension
+
+
+class CachedTokenScheme(OpenApiAuthenticationExtension):
+    """Document cached token auth like DRF's TokenAuthentication"""
+
+    target_class = "core.authentication.CachedTokenAuthentication"
+    name = "tokenAuth"
+
+    def get_security_definition(self, auto_schema):
+        return {
+            "type": "apiKey",
+            "in": "header",
+            "name": "Authorization",
+            "description": (
+                'Token-based authentication with required prefix "Token"'
+            ),
+        }
+
+
+class SignedTokenScheme(OpenApiAuthenticationExtension):
+    """Document signed access tokens as HTTP bearer auth"""
+
+    target_class = "core.authentication.SignedTokenAuthentication"
+    name = "bearerAuth"
+
+    def get_security_definition(self, auto_schema):
+        return {"type": "http", "scheme": "bearer"}
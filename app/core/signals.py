@@ -0,0 +1,156 @@
+"""Signal handlers for the core app"""
+
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from core.authentication import get_token_cache, token_cache_key
+from core.models import ImageBlob, Recipe, Tag, Ingredient
+
+
+AUTH_USER_FIELDS = {"password", "is_active"}
+
+_deletes = threading.local()
+
+
+@contextmanager
+def batched_deletes():
+    """
+    Defer the post_delete work of the rows deleted in the block and run it
+    once the block succeeds: one collection version bump per user and one
+    decref per image, by the number of deleted recipes that used it.
+    """
+    batch = _deletes.batch = {"users": set(), "images": Counter()}
+    try:
+        yield
+    finally:
+        del _deletes.batch
+
+    for name, count in batch["images"].items():
+        ImageBlob.objects.decref(name, count)
+    for user_id in batch["users"]:
+        get_user_model().objects.bump_collection_version(user_id)
+
+
+def get_delete_batch():
+    """Return the batch of the enclosing batched_deletes(), if any"""
+    return getattr(_deletes, "batch", None)
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    """Stop accepting a deleted token from the cache"""
+    get_token_cache().delete(token_cache_key(instance.key))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def evict_user_tokens(sender, instance, update_fields=None, **kwargs):
+    """Drop cached tokens when a user changes password or is deactivated"""
+    if update_fields and not AUTH_USER_FIELDS.intersection(update_fields):
+        return
+
+    keys = Token.objects.filter(user=instance).values_list("key", flat=True)
+    get_token_cache().delete_many([token_cache_key(key) for key in keys])
+
+
+def touch_recipes(queryset):
+    """Bump updated_at on recipes whose nested representation changed"""
+    queryset.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def bump_collection_version(sender, instance, signal, **kwargs):
+    """Invalidate the owner's collection when a row changes"""
+    batch = get_delete_batch()
+    if batch is not None and signal is post_delete:
+        batch["users"].add(instance.user_id)
+        return
+
+    get_user_model().objects.bump_collection_version(instance.user_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def touch_linked_recipes(sender, instance, created=False, **kwargs):
+    """Renaming or deleting a tag or ingredient changes its recipes"""
+    if created:
+        return
+
+    related_name = "tags" if sender is Tag else "ingredients"
+    touch_recipes(Recipe.objects.filter(**{related_name: instance}))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_relinked_recipes(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """Adding or removing links changes the recipes involved"""
+    if not reverse:
+        if action not in ("post_add", "post_remove", "post_clear"):
+            return
+        recipes = Recipe.objects.filter(pk=instance.pk)
+    elif action in ("post_add", "post_remove"):
+        recipes = Recipe.objects.filter(pk__in=pk_set)
+    elif action == "pre_clear":
+        related_name = (
+            "tags" if sender is Recipe.tags.through else "ingredients"
+        )
+        recipes = Recipe.objects.filter(**{related_name: instance})
+    else:
+        return
+
+    touch_recipes(recipes)
+    get_user_model().objects.bump_collection_version(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+def track_image_references(sender, instance, **kwargs):
+    """Move the reference when a recipe's image is set or replaced"""
+    # an image that was never loaded or assigned cannot have changed
+    if "image" not in instance.__dict__:
+        return
+
+    old = getattr(instance, "_loaded_image", None) or ""
+    new = instance.image.name or ""
+    if old == new:
+        return
+
+    if new:
+        ImageBlob.objects.incref(new)
+    if old:
+        ImageBlob.objects.decref(old)
+    instance._loaded_image = new
+
+
+@receiver(post_delete, sender=Recipe)
+def release_image_reference(sender, instance, **kwargs):
+    """Drop the reference held by a deleted recipe"""
+    if not instance.image:
+        return
+
+    batch = get_delete_batch()
+    if batch is not None:
+        batch["images"][instance.image.name] += 1
+    else:
+        ImageBlob.objects.decref(instance.image.name)
@@ -0,0 +1,86 @@
+"""File storage for recipe images"""
+
+import os
+import tempfile
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+from core.images import content_hash
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File storage that names files after the SHA-256 of their content.
+    upload_to still picks the directory and extension. Identical uploads
+    map to one file, which is written once, atomically, and never renamed,
+    so its URL can be cached forever. Reusing a file locks its ImageBlob
+    row, the one gc_images deletes under, and restarts the grace period of
+    an unreferenced blob, so the file stays until the saving recipe takes
+    its reference.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+
+        digest = content_hash(content)
+        directory, filename = os.path.split(name)
+        ext = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory, digest[:2], f"{digest}{ext}")
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # the name is derived from the content, an existing file is a match
+        return name
+
+    def _save(self, name, content):
+        from core.models import ImageBlob
+
+        full_path = self.path(name)
+        with transaction.atomic():
+            # waits for a gc_images run holding the blob to finish with it
+            blob = (
+                ImageBlob.objects.select_for_update()
+                .filter(name=name)
+                .first()
+            )
+            if blob is not None and blob.refcount == 0:
+                blob.unreferenced_at = timezone.now()
+                blob.save(update_fields=["unreferenced_at"])
+            # missing when collected, or when a collection was interrupted
+            if not os.path.exists(full_path):
+                self._write(full_path, content)
+
+        return name
+
+    def _write(self, full_path, content):
+        """Write the content to full_path atomically"""
+        directory = os.path.dirname(full_path)
+        os.makedirs(
+            directory,
+            mode=self.directory_permissions_mode or 0o777,
+            exist_ok=True,
+        )
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in content.chunks():
+                    tmp.write(chunk)
+            # mkstemp creates the file readable by its owner only
+            mode = self.file_permissions_mode
+            os.chmod(tmp_path, 0o644 if mode is None else mode)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+recipe_image_storage = ContentAddressedStorage()
@@ -0,0 +1,137 @@
+"""Tests for API authentication classes"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.tokens import create_access_token
+
+
+ME_URL = reverse("user:me")
+RECIPE_URL = reverse("recipe:recipe-list")
+
+
+def create_user(email="user@example.com", password="password123"):
+    """Create and return a new user"""
+    return get_user_model().objects.create_user(email=email, password=password)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test the cached token authentication class"""
+
+    def setUp(self):
+        caches[settings.AUTH_TOKEN_CACHE].clear()
+        self.user = create_user()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_cached_token_skips_auth_query(self):
+        """Test a repeat request does not query the database to auth"""
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["email"], self.user.email)
+
+    def test_invalid_token_rejected(self):
+        """Test unknown tokens are rejected and not cached"""
+        self.client.credentials(HTTP_AUTHORIZATION="Token invalid")
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_is_evicted(self):
+        """Test a deleted token stops working immediately"""
+        self.client.get(ME_URL)
+
+        self.token.delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_evicted(self):
+        """Test deactivating a user stops their cached token working"""
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_is_evicted(self):
+        """Test changing password reloads the user on the next request"""
+        self.client.get(ME_URL)
+
+        self.user.set_password("newpassword123")
+        self.user.save(update_fields=["password"])
+
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_unrelated_user_update_keeps_cache(self):
+        """Test saving other user fields does not evict the token"""
+        self.client.get(ME_URL)
+
+        self.user.name = "New name"
+        self.user.save(update_fields=["name"])
+
+        with self.assertNumQueries(0):
+            self.client.get(ME_URL)
+
+
+class SignedTokenAuthenticationTests(TestCase):
+    """Test stateless signed access tokens"""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {create_access_token(self.user)}"
+        )
+
+    def test_access_token_authenticates_without_auth_query(self):
+        """Test a valid access token needs no database lookup"""
+        # the collection version and the recipe list itself
+        with self.assertNumQueries(2):
+            res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_tampered_token_rejected(self):
+        """Test a token with a bad signature is rejected"""
+        token = create_access_token(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}x")
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(SIGNED_TOKEN_ACCESS_LIFETIME=-1)
+    def test_expired_token_rejected(self):
+        """Test an access token past its lifetime is rejected"""
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_update_profile_with_access_token(self):
+        """Test updating the profile keeps fields missing from the token"""
+        res = self.client.patch(ME_URL, {"password": "newpassword123"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("newpassword123"))
+        self.assertEqual(self.user.email, "user@example.com")
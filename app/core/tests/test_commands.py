@@ -2,13 +2,33 @@
 Test custom Django commands
 """
 
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
 from unittest.mock import patch
 
+from PIL import Image
 from psycopg2 import OperationalError as Psycopg2Error
 
-from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from core.images import webp_name
+from core.models import (
+    ImageBlob,
+    ImportCheckpoint,
+    Ingredient,
+    Recipe,
+    Tag,
+)
 
 
 @patch("core.management.commands.wait_for_db.Command.check")
@@ -33,3 +53,283 @@ class CommandTests(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=["default"])
+
+
+class BackfillWebpTests(TestCase):
+    """Test the backfill_webp command"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+        user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        self.recipe = Recipe.objects.create(
+            user=user, title="Recipe", time_minutes=5, price=Decimal("1.00")
+        )
+        buffer = BytesIO()
+        Image.new("RGB", (20, 10)).save(buffer, format="PNG")
+        self.recipe.image.save("photo.png", ContentFile(buffer.getvalue()))
+
+    def test_backfill_webp(self):
+        """Test missing WebP encodings are written once"""
+        out = StringIO()
+        call_command("backfill_webp", workers=1, stdout=out)
+
+        with Image.open(webp_name(self.recipe.image.path)) as img:
+            self.assertEqual(img.format, "WEBP")
+            self.assertEqual(img.size, (20, 10))
+        self.assertIn("Encoded 1 images", out.getvalue())
+
+        out = StringIO()
+        call_command("backfill_webp", workers=1, stdout=out)
+
+        self.assertIn("Encoded 0 images", out.getvalue())
+
+
+class GcImagesTests(TestCase):
+    """Test the gc_images command"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+
+    def _create_recipe(self, content):
+        recipe = Recipe.objects.create(
+            user=self.user, title="Recipe", time_minutes=5
+        )
+        recipe.image.save("photo.jpg", ContentFile(content))
+        return recipe
+
+    def test_gc_images(self):
+        """Test only images unreferenced past the grace period go"""
+        kept = self._create_recipe(b"kept")
+        recent = self._create_recipe(b"recent")
+        old = self._create_recipe(b"old")
+        kept_path, recent_path, old_path = [
+            recipe.image.path for recipe in (kept, recent, old)
+        ]
+        old_name = old.image.name
+        recent.delete()
+        old.delete()
+        ImageBlob.objects.filter(name=old_name).update(
+            unreferenced_at=timezone.now() - timedelta(days=2)
+        )
+
+        call_command("gc_images", grace_hours=24, stdout=StringIO())
+
+        self.assertTrue(os.path.exists(kept_path))
+        self.assertTrue(os.path.exists(recent_path))
+        self.assertFalse(os.path.exists(old_path))
+        self.assertFalse(ImageBlob.objects.filter(name=old_name).exists())
+
+    def test_gc_images_keeps_reuploaded_image(self):
+        """Test uploading a collectable image again keeps its file"""
+        recipe = self._create_recipe(b"again")
+        path, name = recipe.image.path, recipe.image.name
+        recipe.delete()
+        ImageBlob.objects.filter(name=name).update(
+            unreferenced_at=timezone.now() - timedelta(days=2)
+        )
+
+        # the file is reused but the recipe is not saved yet
+        upload = Recipe(user=self.user, title="Recipe", time_minutes=5)
+        upload.image.save("photo.jpg", ContentFile(b"again"), save=False)
+        call_command("gc_images", grace_hours=24, stdout=StringIO())
+
+        self.assertTrue(os.path.exists(path))
+        self.assertTrue(ImageBlob.objects.filter(name=name).exists())
+
+    def test_upload_rewrites_collected_file(self):
+        """Test a blob whose file is gone gets the file written again"""
+        recipe = self._create_recipe(b"lost")
+        os.remove(recipe.image.path)
+
+        other = self._create_recipe(b"lost")
+
+        with other.image.open() as f:
+            self.assertEqual(f.read(), b"lost")
+
+    def test_gc_images_dry_run(self):
+        """Test a dry run deletes nothing"""
+        recipe = self._create_recipe(b"old")
+        path = recipe.image.path
+        recipe.delete()
+
+        call_command(
+            "gc_images", grace_hours=0, dry_run=True, stdout=StringIO()
+        )
+
+        self.assertTrue(os.path.exists(path))
+
+
+class ImportRecipesTests(TestCase):
+    """Test the import_recipes command"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+
+    def _write(self, filename, content):
+        path = os.path.join(self.tmpdir, filename)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def _import(self, path, **options):
+        out = StringIO()
+        call_command(
+            "import_recipes", path, user=self.user.email, stdout=out, **options
+        )
+        return out.getvalue()
+
+    def test_import_jsonl(self):
+        """Test importing recipes with shared tags and ingredients"""
+        existing = Tag.objects.create(user=self.user, name="Vegan")
+        rows = [
+            {
+                "title": f"Recipe {i}",
+                "time_minutes": 5 + i,
+                "price": "4.50",
+                "tags": ["Vegan", "Quick"],
+                "ingredients": [{"name": "Kale"}],
+            }
+            for i in range(5)
+        ]
+        path = self._write(
+            "recipes.jsonl", "\n".join(json.dumps(row) for row in rows)
+        )
+        version = self.user.collection_version
+
+        out = self._import(path, batch_size=2)
+
+        recipes = Recipe.objects.filter(user=self.user).order_by("id")
+        self.assertEqual(
+            [r.title for r in recipes], [f"Recipe {i}" for i in range(5)]
+        )
+        self.assertEqual(recipes[0].price, Decimal("4.50"))
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Ingredient.objects.count(), 1)
+        for recipe in recipes:
+            self.assertIn(existing, recipe.tags.all())
+            self.assertEqual(recipe.ingredients.count(), 1)
+        self.user.refresh_from_db()
+        self.assertGreater(self.user.collection_version, version)
+        self.assertIn("rows/s", out)
+        self.assertIn("Imported 5 recipes", out)
+
+    def test_import_csv(self):
+        """Test importing the CSV layout of the export endpoint"""
+        path = self._write(
+            "recipes.csv",
+            "id,title,description,time_minutes,price,link,image,tags,"
+            "ingredients\n"
+            '1,Soup,Hot,10,,,,"Vegan; Quick",Kale\n',
+        )
+
+        self._import(path)
+
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(recipe.title, "Soup")
+        self.assertIsNone(recipe.price)
+        self.assertEqual(
+            sorted(tag.name for tag in recipe.tags.all()), ["Quick", "Vegan"]
+        )
+
+    def test_import_resumes_from_checkpoint(self):
+        """Test rows recorded in the checkpoint are not imported again"""
+        rows = [{"title": f"Recipe {i}", "time_minutes": 5} for i in range(4)]
+        path = self._write(
+            "recipes.jsonl", "\n".join(json.dumps(row) for row in rows)
+        )
+        ImportCheckpoint.objects.create(name=path, rows=3)
+
+        self._import(path)
+
+        titles = Recipe.objects.values_list("title", flat=True)
+        self.assertEqual(list(titles), ["Recipe 3"])
+        self.assertEqual(ImportCheckpoint.objects.get(name=path).rows, 4)
+
+    def test_import_invalid_row(self):
+        """Test invalid rows stop the import at the last full batch"""
+        rows = [{"title": "Good", "time_minutes": 5}, {"title": "Bad"}]
+        path = self._write(
+            "recipes.jsonl", "\n".join(json.dumps(row) for row in rows)
+        )
+
+        with self.assertRaises(CommandError):
+            self._import(path, batch_size=1)
+
+        self.assertEqual(Recipe.objects.count(), 1)
+        self.assertEqual(ImportCheckpoint.objects.get(name=path).rows, 1)
+
+    def test_import_value_too_long(self):
+        """Test values the columns cannot hold name their row"""
+        rows = [
+            {"title": "Good", "time_minutes": 5},
+            {"title": "x" * 256, "time_minutes": 5},
+        ]
+        path = self._write(
+            "recipes.jsonl", "\n".join(json.dumps(row) for row in rows)
+        )
+
+        with self.assertRaisesMessage(CommandError, "Row 2: invalid title"):
+            self._import(path)
+
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_import_zero_price(self):
+        """Test a price of 0 is kept rather than read as missing"""
+        path = self._write(
+            "recipes.jsonl", json.dumps({"time_minutes": 5, "price": 0})
+        )
+
+        self._import(path)
+
+        self.assertEqual(Recipe.objects.get().price, Decimal("0"))
+
+    def test_import_checkpoint_rolls_back_with_batch(self):
+        """Test a failed batch leaves neither its rows nor its progress"""
+        path = self._write(
+            "recipes.jsonl", json.dumps({"title": "Soup", "time_minutes": 5})
+        )
+
+        with patch(
+            "core.models.UserManager.bump_collection_version",
+            side_effect=RuntimeError,
+        ):
+            with self.assertRaises(RuntimeError):
+                self._import(path)
+
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+
+class BenchmarkRenderersTests(SimpleTestCase):
+    """Test the renderer benchmark"""
+
+    def test_benchmark_renderers(self):
+        """Test every renderer is timed and measured"""
+        out = StringIO()
+
+        call_command(
+            "benchmark_renderers", "--sizes", "2", "--repeat", "1", stdout=out
+        )
+
+        output = out.getvalue()
+        for name in ["json", "orjson", "msgpack"]:
+            self.assertIn(f"2 recipes, {name}: ", output)
@@ -0,0 +1,158 @@
+"""
+Tests for request metrics
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import metrics
+
+
+METRICS_URL = reverse("metrics")
+RECIPES_URL = reverse("recipe:recipe-list")
+LABELS = (("view", "RecipeViewSet"), ("action", "list"))
+
+
+class MetricsDirMixin:
+    """Collect metrics in an empty directory"""
+
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.metrics_dir)
+        directory = override_settings(METRICS_DIR=self.metrics_dir)
+        directory.enable()
+        self.addCleanup(directory.disable)
+        metrics.store.reset()
+        self.addCleanup(metrics.store.reset)
+
+
+class MetricsStoreTests(MetricsDirMixin, SimpleTestCase):
+    """Test the metrics store and text format"""
+
+    def _write(self, name, data):
+        with open(os.path.join(self.metrics_dir, name), "w") as f:
+            json.dump(data, f)
+
+    def _counter(self, value):
+        labels = [list(pair) for pair in LABELS]
+        return {
+            "counters": [["db_queries_total", labels, value]],
+            "histograms": [],
+        }
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test observations count towards every bucket they fit"""
+        metrics.store.observe("h", LABELS, 5, (1, 10, 100))
+        metrics.store.observe("h", LABELS, 50, (1, 10, 100))
+
+        histogram = metrics.store.histograms["h", LABELS]
+        self.assertEqual(histogram["counts"], [0, 1, 2])
+        self.assertEqual(histogram["sum"], 55)
+        self.assertEqual(histogram["count"], 2)
+
+    def test_collect_adds_up_processes(self):
+        """Test the files of other workers are included"""
+        metrics.store.inc("db_queries_total", LABELS, 3)
+        self._write(f"metrics-{os.getppid()}-a1b2.json", self._counter(4))
+
+        counters, _ = metrics.store.collect()
+
+        self.assertEqual(counters["db_queries_total", LABELS], 7)
+
+    def test_collect_merges_exited_processes(self):
+        """Test files of exited workers move into the totals once"""
+        for name, value in [("metrics-8-a.json", 2), ("metrics-9-b.json", 5)]:
+            self._write(name, self._counter(value))
+        self._write("totals.json", self._counter(10))
+
+        with patch("core.metrics.is_running", lambda pid: pid != 9):
+            first, _ = metrics.store.collect()
+            second, _ = metrics.store.collect()
+
+        self.assertEqual(first["db_queries_total", LABELS], 17)
+        self.assertEqual(second["db_queries_total", LABELS], 17)
+        files = os.listdir(self.metrics_dir)
+        self.assertIn("metrics-8-a.json", files)
+        self.assertNotIn("metrics-9-b.json", files)
+
+    def test_reused_pid_gets_own_file(self):
+        """Test a new process never writes over an exited one's file"""
+        self.assertNotEqual(metrics.MetricsStore().path, metrics.store.path)
+
+    def test_render(self):
+        """Test metrics are rendered in the Prometheus text format"""
+        metrics.store.observe(
+            "http_request_duration_seconds", LABELS, 0.2, (0.1, 0.5)
+        )
+
+        text = metrics.render_metrics(*metrics.store.collect())
+
+        self.assertIn("# TYPE http_request_duration_seconds histogram", text)
+        labels = 'view="RecipeViewSet",action="list"'
+        for sample in [
+            f'_bucket{{{labels},le="0.1"}} 0',
+            f'_bucket{{{labels},le="0.5"}} 1',
+            f'_bucket{{{labels},le="+Inf"}} 1',
+            f"_sum{{{labels}}} 0.2",
+            f"_count{{{labels}}} 1",
+        ]:
+            self.assertIn(f"http_request_duration_seconds{sample}\n", text)
+
+    def test_escape(self):
+        """Test label values are escaped"""
+        self.assertEqual(metrics.escape('a"b\\c\nd'), 'a\\"b\\\\c\\nd')
+
+
+class MetricsEndpointTests(MetricsDirMixin, TestCase):
+    """Test requests are recorded and exposed"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="staff@example.com", password="testpass123", is_staff=True
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_requests_recorded_per_view_and_action(self):
+        """Test the count, latency, queries and size of a request"""
+        self.client.get(RECIPES_URL)
+
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res["Content-Type"].startswith("text/plain"))
+        text = res.content.decode()
+        labels = 'view="RecipeViewSet",action="list"'
+        self.assertIn(
+            f'http_requests_total{{{labels},method="GET",status="200"}} 1',
+            text,
+        )
+        for sample in [
+            "http_request_duration_seconds_count{%s} 1",
+            "http_response_size_bytes_count{%s} 1",
+            "db_queries_total{%s} ",
+            "db_query_duration_seconds_total{%s} ",
+        ]:
+            self.assertIn(sample % labels, text)
+
+    def test_staff_only(self):
+        """Test other users cannot read the metrics"""
+        user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(user)
+
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
@@ -1,14 +1,16 @@
 """Tests for models"""
 
+import hashlib
+import shutil
+import tempfile
 from decimal import Decimal
 
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 
 from core import models
 
-from unittest.mock import patch
-
 
 def create_user(email="user@example.com", password="password123"):
     """Create and return a new user"""
@@ -86,11 +88,75 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(ingredient), ingredient.name)
 
-    @patch("core.models.uuid.uuid4")
-    def test_recipe_file_uuid(self, mock_uuid):
+    def test_recipe_file_path(self):
         """Test generating image path"""
-        uuid = "test-uuid"
-        mock_uuid.return_value = uuid
-        file_path = models.recipe_file_path(None, "example.jpg")
+        file_path = models.recipe_file_path(None, "example.JPG")
+
+        self.assertEqual(file_path, "uploads/recipe/image.jpg")
+
+
+class ImageStorageTests(TestCase):
+    """Test content-addressed image storage and reference counting"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.user = create_user()
 
-        self.assertEqual(file_path, f"uploads/recipe/{uuid}.jpg")
+    def _create_recipe(self, content=b"image"):
+        recipe = models.Recipe.objects.create(
+            user=self.user, title="Recipe", time_minutes=5
+        )
+        recipe.image.save("photo.JPG", ContentFile(content))
+        return recipe
+
+    def test_image_named_after_content(self):
+        """Test images are stored under the hash of their content"""
+        recipe = self._create_recipe()
+
+        digest = hashlib.sha256(b"image").hexdigest()
+        self.assertEqual(
+            recipe.image.name, f"uploads/recipe/{digest[:2]}/{digest}.jpg"
+        )
+        with recipe.image.open() as f:
+            self.assertEqual(f.read(), b"image")
+
+    def test_identical_images_share_a_file(self):
+        """Test identical uploads are stored once and counted twice"""
+        recipe1 = self._create_recipe()
+        recipe2 = self._create_recipe()
+        other = self._create_recipe(b"other image")
+
+        self.assertEqual(recipe1.image.name, recipe2.image.name)
+        self.assertNotEqual(recipe1.image.name, other.image.name)
+        blob = models.ImageBlob.objects.get(name=recipe1.image.name)
+        self.assertEqual(blob.refcount, 2)
+
+    def test_replacing_and_deleting_release_references(self):
+        """Test references move with the image and go with the recipe"""
+        recipe1 = self._create_recipe()
+        recipe2 = self._create_recipe()
+        name = recipe1.image.name
+
+        recipe1 = models.Recipe.objects.get(pk=recipe1.pk)
+        recipe1.image.save("new.jpg", ContentFile(b"new image"))
+        models.Recipe.objects.get(pk=recipe2.pk).delete()
+
+        blob = models.ImageBlob.objects.get(name=name)
+        self.assertEqual(blob.refcount, 0)
+        self.assertIsNotNone(blob.unreferenced_at)
+        new_blob = models.ImageBlob.objects.get(name=recipe1.image.name)
+        self.assertEqual(new_blob.refcount, 1)
+
+    def test_unrelated_saves_keep_references(self):
+        """Test saving a recipe without touching its image changes nothing"""
+        recipe = self._create_recipe()
+        recipe = models.Recipe.objects.get(pk=recipe.pk)
+        recipe.title = "Renamed"
+        recipe.save()
+
+        blob = models.ImageBlob.objects.get(name=recipe.image.name)
+        self.assertEqual(blob.refcount, 1)
@@ -0,0 +1,123 @@
+"""
+Tests for the default renderers and parsers
+"""
+
+import json
+from decimal import Decimal
+from io import BytesIO
+
+import msgpack
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from core.parsers import MessagePackParser, ORJSONParser
+from core.renderers import JSONEncoder, MessagePackRenderer, ORJSONRenderer
+
+
+RECIPE_URL = reverse("recipe:recipe-list")
+
+SAMPLE = {
+    "id": 1,
+    "title": "Crème brûlée",
+    "price": Decimal("5.50"),
+    "image": "http://testserver/media/uploads/recipe/ab/ab.png",
+    "tags": [{"id": 2, "name": gettext_lazy("Dessert")}],
+    "rating": None,
+}
+
+
+class RendererTests(SimpleTestCase):
+    """Test the renderers and parsers"""
+
+    def test_orjson_matches_stdlib(self):
+        """Test orjson renders the same document as the stdlib encoder"""
+        expected = json.loads(json.dumps(SAMPLE, cls=JSONEncoder))
+
+        content = ORJSONRenderer().render(SAMPLE)
+
+        self.assertEqual(json.loads(content), expected)
+        self.assertEqual(json.loads(content)["price"], "5.50")
+
+    def test_orjson_indent(self):
+        """Test indented output is still honoured"""
+        content = ORJSONRenderer().render(
+            {"id": 1}, "application/json; indent=4"
+        )
+
+        self.assertEqual(content, b'{\n    "id": 1\n}')
+
+    def test_indent_renders_decimal_as_text(self):
+        """Test indented output writes decimals as orjson does"""
+        content = ORJSONRenderer().render(
+            {"price": Decimal("5.50")}, "application/json; indent=4"
+        )
+
+        self.assertEqual(json.loads(content), {"price": "5.50"})
+
+    def test_msgpack_round_trip(self):
+        """Test MessagePack output parses back to the same data"""
+        content = MessagePackRenderer().render(SAMPLE)
+
+        data = MessagePackParser().parse(BytesIO(content))
+
+        self.assertEqual(data["title"], SAMPLE["title"])
+        self.assertEqual(data["price"], "5.50")
+        self.assertEqual(data["tags"], [{"id": 2, "name": "Dessert"}])
+
+    def test_invalid_input(self):
+        """Test malformed bodies raise a parse error"""
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(BytesIO(b'{"id": '))
+        with self.assertRaises(ParseError):
+            MessagePackParser().parse(BytesIO(b"\xc1"))
+
+
+class NegotiationTests(TestCase):
+    """Test the formats are selected by content negotiation"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_list_as_msgpack(self):
+        """Test lists are rendered as MessagePack when asked for"""
+        Recipe.objects.create(user=self.user, title="Soup", time_minutes=5)
+
+        res = self.client.get(RECIPE_URL, HTTP_ACCEPT="application/msgpack")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res["Content-Type"], "application/msgpack")
+        data = msgpack.unpackb(res.content, raw=False)
+        self.assertEqual(data["results"][0]["title"], "Soup")
+
+    def test_create_from_msgpack(self):
+        """Test write endpoints accept MessagePack bodies"""
+        payload = {
+            "title": "Soup",
+            "time_minutes": 5,
+            "price": "2.50",
+            "tags": [{"name": "Quick"}],
+        }
+
+        res = self.client.post(RECIPE_URL, payload, format="msgpack")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data["id"])
+        self.assertEqual(recipe.tags.get().name, "Quick")
+
+    def test_json_by_default(self):
+        """Test JSON stays the default format"""
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res["Content-Type"], "application/json")
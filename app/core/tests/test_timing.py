@@ -0,0 +1,85 @@
+"""
+Tests for request timing
+"""
+
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from core.timing import RequestTimer
+from recipe.serializers import RecipeSerializer
+
+
+RECIPES_URL = reverse("recipe:recipe-list")
+
+
+class RequestTimingTests(TestCase):
+    """Test the Server-Timing header and access log"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        self.recipe = Recipe.objects.create(
+            user=user, title="Soup", time_minutes=5
+        )
+        self.recipe.tags.add(Tag.objects.create(user=user, name="Hot"))
+        token = Token.objects.create(user=user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    @override_settings(REQUEST_TIMING=True)
+    def test_server_timing_header(self):
+        """Test every phase is reported in the Server-Timing header"""
+        with self.assertLogs("core.access", "INFO"):
+            res = self.client.get(RECIPES_URL)
+
+        timing = res["Server-Timing"]
+        for phase in ["auth", "serialize", "render", "db", "total"]:
+            self.assertIn(f"{phase};dur=", timing)
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+
+    @override_settings(REQUEST_TIMING=True)
+    def test_access_log(self):
+        """Test a JSON line with the phases and slowest query is logged"""
+        with self.assertLogs("core.access", "INFO") as logs:
+            self.client.get(RECIPES_URL)
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line["view"], "RecipeViewSet")
+        self.assertEqual(line["action"], "list")
+        self.assertEqual(line["status"], 200)
+        self.assertGreater(line["queries"], 0)
+        self.assertIn("SELECT", line["slowest_query"]["sql"])
+        self.assertEqual(
+            set(line["phases"]),
+            {"auth", "serialize", "serialize.nested", "render"},
+        )
+
+    def test_nested_serializers_timed(self):
+        """Test nested lists are timed apart from their parent"""
+        request = RequestFactory().get(RECIPES_URL)
+        request.timer = RequestTimer()
+
+        data = RecipeSerializer(self.recipe, context={"request": request}).data
+
+        self.assertEqual(data["tags"][0]["name"], "Hot")
+        self.assertEqual(
+            set(request.timer.phases), {"serialize", "serialize.nested"}
+        )
+        self.assertLessEqual(
+            request.timer.phases["serialize.nested"],
+            request.timer.phases["serialize"],
+        )
+
+    def test_off_by_default(self):
+        """Test nothing is added unless enabled"""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertNotIn("Server-Timing", res)
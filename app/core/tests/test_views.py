@@ -0,0 +1,199 @@
+"""
+Tests for media views
+"""
+
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.images import variant_name, webp_name
+from core.models import Recipe
+from core.views import RangeNotSatisfiable, accepts_webp, parse_range
+
+
+def media_url(name):
+    """Return the URL of a media file"""
+    return f"{settings.MEDIA_URL}{name}"
+
+
+class MediaViewTests(TestCase):
+    """Test serving uploaded media"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        recipe = Recipe.objects.create(
+            user=self.user, title="Recipe", time_minutes=5
+        )
+        recipe.image.save("photo.png", ContentFile(b"0123456789"))
+        self.name = recipe.image.name
+        # derived files are written next to the original
+        self.webp_path = recipe.image.storage.path(webp_name(self.name))
+        with open(self.webp_path, "wb") as f:
+            f.write(b"webp")
+
+    def _get(self, name, accept="image/png", **extra):
+        return self.client.get(media_url(name), HTTP_ACCEPT=accept, **extra)
+
+    def test_serves_webp_when_accepted(self):
+        """Test the WebP encoding is served to clients accepting it"""
+        res = self._get(self.name, "image/webp,image/*,*/*;q=0.8")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res["Content-Type"], "image/webp")
+        self.assertEqual(b"".join(res.streaming_content), b"webp")
+        self.assertIn("Accept", res["Vary"])
+
+    def test_serves_original_otherwise(self):
+        """Test the original is served when WebP is not accepted"""
+        res = self._get(self.name, "image/png,image/*;q=0.8")
+
+        self.assertEqual(res["Content-Type"], "image/png")
+        self.assertEqual(b"".join(res.streaming_content), b"0123456789")
+        self.assertIn("Accept", res["Vary"])
+
+    def test_cached_as_immutable(self):
+        """Test content-addressed media may be cached privately forever"""
+        res = self._get(self.name)
+
+        self.assertIn("immutable", res["Cache-Control"])
+        self.assertIn("private", res["Cache-Control"])
+        self.assertIn("max-age=31536000", res["Cache-Control"])
+
+    def test_missing_file(self):
+        """Test missing derived files return 404"""
+        res = self._get(variant_name(self.name, "thumb"))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_other_users_media_not_served(self):
+        """Test users cannot read images of other users' recipes"""
+        other = get_user_model().objects.create_user(
+            email="other@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(other)
+
+        res = self._get(self.name)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_staff_can_read_all_media(self):
+        """Test staff users can read any image"""
+        staff = get_user_model().objects.create_user(
+            email="staff@example.com", password="testpass123", is_staff=True
+        )
+        self.client.force_authenticate(staff)
+
+        res = self._get(self.name)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_auth_required(self):
+        """Test anonymous requests are refused"""
+        self.client.force_authenticate(None)
+
+        res = self._get(self.name)
+
+        self.assertIn(
+            res.status_code,
+            [status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN],
+        )
+
+    def test_range_request(self):
+        """Test a byte range is answered with 206 and only that range"""
+        res = self._get(self.name, HTTP_RANGE="bytes=2-5")
+
+        self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(res["Content-Range"], "bytes 2-5/10")
+        self.assertEqual(res["Content-Length"], "4")
+        self.assertEqual(b"".join(res.streaming_content), b"2345")
+
+    def test_range_not_satisfiable(self):
+        """Test ranges past the end of the file are refused"""
+        res = self._get(self.name, HTTP_RANGE="bytes=20-")
+
+        self.assertEqual(
+            res.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        self.assertEqual(res["Content-Range"], "bytes */10")
+
+    @override_settings(MEDIA_SENDFILE="x-accel")
+    def test_x_accel_redirect(self):
+        """Test the transfer can be handed to nginx"""
+        res = self._get(self.name)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res["X-Accel-Redirect"],
+            f"{settings.MEDIA_ACCEL_PREFIX}{self.name}",
+        )
+        self.assertEqual(res.content, b"")
+
+    @override_settings(MEDIA_SENDFILE="x-sendfile")
+    def test_x_sendfile(self):
+        """Test the transfer can be handed to a proxy by path"""
+        res = self._get(self.name, "image/webp")
+
+        self.assertEqual(res["X-Sendfile"], self.webp_path)
+        self.assertEqual(res["Content-Type"], "image/webp")
+
+
+class MediaHelperTests(SimpleTestCase):
+    """Test the helpers of the media view"""
+
+    def test_accepts_webp(self):
+        """Test parsing of the Accept header"""
+        cases = [
+            ("image/webp", True),
+            ("image/avif,image/webp,*/*", True),
+            ("image/webp;q=0.5", True),
+            ("image/webp;q=0", False),
+            ("image/png,*/*", False),
+            ("", False),
+        ]
+        factory = RequestFactory()
+        for accept, expected in cases:
+            request = factory.get("/", HTTP_ACCEPT=accept)
+            self.assertEqual(accepts_webp(request), expected, accept)
+
+    def test_parse_range(self):
+        """Test parsing of the Range header"""
+        cases = [
+            (None, None),
+            ("bytes=0-4", (0, 4)),
+            ("bytes=5-", (5, 9)),
+            ("bytes=-3", (7, 9)),
+            ("bytes=-30", (0, 9)),
+            ("bytes=8-20", (8, 9)),
+            ("bytes=0-1,4-5", None),
+            ("bytes=4-2", None),
+            ("items=0-4", None),
+        ]
+        for header, expected in cases:
+            self.assertEqual(parse_range(header, 10), expected, header)
+
+        for header in ["bytes=10-", "bytes=20-", "bytes=12-15", "bytes=-0"]:
+            with self.assertRaises(RangeNotSatisfiable, msg=header):
+                parse_range(header, 10)
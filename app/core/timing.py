@@ -0,0 +1,80 @@
+"""Per-request timing of the phases of the API"""
+
+import time
+from contextlib import contextmanager
+
+from rest_framework import serializers
+
+
+class RequestTimer:
+    """
+    Phase durations and query statistics of a request.
+    The timer is also an execute wrapper, it counts the queries, adds up
+    their time and keeps the slowest statement, without its parameters.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest_sql = None
+        self.slowest_seconds = 0.0
+
+    def add(self, name, seconds):
+        """Add seconds to a phase"""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - started
+            self.queries += 1
+            self.db_seconds += seconds
+            if seconds >= self.slowest_seconds:
+                self.slowest_sql, self.slowest_seconds = sql, seconds
+
+
+def get_timer(request):
+    """Return the timer of a Django or DRF request, None when off"""
+    request = getattr(request, "_request", request)
+    return getattr(request, "timer", None)
+
+
+@contextmanager
+def timed(request, phase):
+    """Add the time spent in the block to a phase of the request"""
+    timer = get_timer(request)
+    if timer is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(phase, time.perf_counter() - started)
+
+
+class TimedDataMixin:
+    """Time building serializer.data as the serialize phase"""
+
+    @property
+    def data(self):
+        with timed(self.context.get("request"), "serialize"):
+            return super().data
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    """
+    List serializer timing its items as the serialize.nested phase when
+    it is a field of another serializer, and as serialize otherwise.
+    Nested time is also part of the serialize time of the parent.
+    """
+
+    def to_representation(self, data):
+        phase = "serialize" if self.parent is None else "serialize.nested"
+        with timed(self.context.get("request"), phase):
+            return super().to_representation(data)
@@ -0,0 +1,85 @@
+"""Signed, expiring access and refresh tokens"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db import router
+from django.db.models import DEFERRED
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+
+ACCESS_SALT = "core.tokens.access"
+REFRESH_SALT = "core.tokens.refresh"
+
+# user fields carried in an access token, enough to build request.user
+ACCESS_CLAIMS = ["id", "email", "name", "is_active", "is_staff"]
+
+
+def _password_fingerprint(user):
+    """Return a digest that changes whenever the user's password does"""
+    return salted_hmac("core.tokens.password", user.password).hexdigest()
+
+
+def create_access_token(user):
+    """Return a short-lived access token for a user"""
+    claims = {field: getattr(user, field) for field in ACCESS_CLAIMS}
+    return signing.dumps(claims, salt=ACCESS_SALT, compress=True)
+
+
+def create_refresh_token(user):
+    """Return a long-lived refresh token, revoked by a password change"""
+    claims = {"id": user.pk, "pwd": _password_fingerprint(user)}
+    return signing.dumps(claims, salt=REFRESH_SALT)
+
+
+def create_token_pair(user):
+    """Return the access/refresh token payload for a user"""
+    return {
+        "access": create_access_token(user),
+        "refresh": create_refresh_token(user),
+        "expires_in": settings.SIGNED_TOKEN_ACCESS_LIFETIME,
+    }
+
+
+def user_from_access_token(token):
+    """
+    Return the user for an access token without touching the database.
+    Fields not carried in the token are deferred and load on first access.
+    Raises signing.BadSignature if the token is invalid or expired.
+    """
+    claims = signing.loads(
+        token,
+        salt=ACCESS_SALT,
+        max_age=settings.SIGNED_TOKEN_ACCESS_LIFETIME,
+    )
+    user_model = get_user_model()
+    field_names = [f.attname for f in user_model._meta.concrete_fields]
+    values = [claims.get(name, DEFERRED) for name in field_names]
+
+    return user_model.from_db(
+        router.db_for_read(user_model), field_names, values
+    )
+
+
+def user_from_refresh_token(token):
+    """
+    Return the active user for a refresh token.
+    Raises signing.BadSignature if the token is invalid, expired or was
+    issued before the user's password last changed.
+    """
+    claims = signing.loads(
+        token,
+        salt=REFRESH_SALT,
+        max_age=settings.SIGNED_TOKEN_REFRESH_LIFETIME,
+    )
+    user = (
+        get_user_model()
+        .objects.filter(pk=claims["id"], is_active=True)
+        .first()
+    )
+    if user is None or not constant_time_compare(
+        claims["pwd"], _password_fingerprint(user)
+    ):
+        raise signing.BadSignature("Refresh token has been revoked")
+
+    return user
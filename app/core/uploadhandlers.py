@@ -0,0 +1,114 @@
+"""Upload handlers for recipe images"""
+
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions, status
+
+from PIL import Image
+
+
+# room for the multipart boundaries and headers around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+# how much of the file may be buffered while looking for the image header
+PROBE_BYTES = 256 * 1024
+
+
+class UploadTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = _("Upload is too large.")
+    default_code = "upload_too_large"
+
+
+class LimitedImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Stream an uploaded image to a temporary file within fixed limits.
+    The request is refused from its Content-Length, or as soon as the body
+    outgrows RECIPE_IMAGE_MAX_BYTES, and the format and dimensions are read
+    from the image header alone, so bad uploads are rejected before the
+    rest of the body is read and nothing is ever decoded in memory.
+    The SHA-256 of the content is computed on the way through and kept as
+    content_hash on the uploaded file, ready for content-addressed storage.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_bytes = settings.RECIPE_IMAGE_MAX_BYTES
+        self.max_pixels = settings.RECIPE_IMAGE_MAX_PIXELS
+        self.formats = settings.RECIPE_IMAGE_FORMATS
+        self.received = 0
+        self.head = b""
+        self.probed = False
+        self.hasher = hashlib.sha256()
+
+    def handle_raw_input(
+        self, input_data, META, content_length, boundary, encoding=None
+    ):
+        if content_length > self.max_bytes + MULTIPART_OVERHEAD:
+            raise UploadTooLarge()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.head = b""
+        self.probed = False
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            self._reject(UploadTooLarge())
+
+        if not self.probed:
+            self.head += raw_data
+            self._probe(final=len(self.head) >= PROBE_BYTES)
+
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if not self.probed:
+            self._probe(final=True)
+
+        uploaded = super().file_complete(file_size)
+        uploaded.content_hash = self.hasher.hexdigest()
+        return uploaded
+
+    def _probe(self, final):
+        """Check the format and size once the image header is buffered"""
+        try:
+            with Image.open(BytesIO(self.head)) as img:
+                img_format, (width, height) = img.format, img.size
+        except Image.DecompressionBombError:
+            self._reject(self._invalid(_("Image has too many pixels.")))
+        except (OSError, SyntaxError, ValueError):
+            # the header may simply not have arrived yet
+            if final:
+                self._reject(self._invalid(_("Upload a valid image.")))
+            return
+
+        if img_format not in self.formats:
+            self._reject(
+                self._invalid(
+                    _("Unsupported image format %(format)s.")
+                    % {"format": img_format}
+                )
+            )
+        if width * height > self.max_pixels:
+            self._reject(self._invalid(_("Image has too many pixels.")))
+
+        self.probed = True
+        self.head = b""
+
+    def _invalid(self, message):
+        return exceptions.ValidationError({self.field_name: [message]})
+
+    def _reject(self, exc):
+        """Drop the partial temporary file and abort the upload"""
+        if getattr(self, "file", None) is not None:
+            self.file.close()
+        raise exc
@@ -1,3 +1,271 @@
-from django.shortcuts import render  # noqa
+"""Views for serving uploaded media"""
 
-# Create your views here.
+import mimetypes
+import os
+import posixpath
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseNotModified,
+)
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from rest_framework import status
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.views import APIView
+
+from core.authentication import (
+    CachedTokenAuthentication,
+    SignedTokenAuthentication,
+)
+from core import metrics
+from core.images import original_prefix, webp_name
+from core.models import Recipe
+
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def accepts_webp(request):
+    """Return whether the request's Accept header allows image/webp"""
+    for media_range in request.META.get("HTTP_ACCEPT", "").split(","):
+        media_type, *params = media_range.split(";")
+        if media_type.strip().lower() != "image/webp":
+            continue
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+
+    return False
+
+
+class RangeNotSatisfiable(Exception):
+    """The requested byte range lies outside the file"""
+
+
+def parse_range(header, size):
+    """
+    Return the (start, end) byte positions, inclusive, requested by a Range
+    header, or None to send the whole file. Only single ranges are
+    supported, anything else is answered with the full file.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+
+    spec = header.split("=", 1)[1].strip()
+    if "," in spec:
+        return None
+
+    first, sep, last = spec.partition("-")
+    try:
+        if not sep:
+            return None
+        if not first:
+            # a suffix range, the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(size - length, 0), size - 1
+
+        start = int(first)
+        end = int(last) if last else None
+    except ValueError:
+        return None
+
+    if end is not None and start > end:
+        # malformed, the header is ignored
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+
+    return start, size - 1 if end is None else min(end, size - 1)
+
+
+class FileRange:
+    """
+    A read-only window onto part of an open file.
+    fileno() is kept so a WSGI server's file_wrapper can still send the
+    window with os.sendfile, starting at the current offset and bounded by
+    Content-Length.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+class IgnoreAcceptNegotiation(BaseContentNegotiation):
+    """Negotiation that leaves the Accept header to the view"""
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class MediaView(APIView):
+    """
+    Serve an uploaded file to a user allowed to see it.
+    Users may read the images of their own recipes, staff any image. The
+    transfer itself is handed to the front proxy with X-Accel-Redirect or
+    X-Sendfile when MEDIA_SENDFILE is set. Otherwise the file is returned
+    with Range support, for the WSGI server's file_wrapper to send from
+    the file descriptor. Clients that accept WebP get the pre-encoded
+    sibling.
+    """
+
+    authentication_classes = [
+        CachedTokenAuthentication,
+        SignedTokenAuthentication,
+        SessionAuthentication,
+    ]
+    permission_classes = [IsAuthenticated]
+    # image requests rarely accept JSON, they must not end in a 406
+    content_negotiation_class = IgnoreAcceptNegotiation
+
+    def has_access(self, name):
+        """Return whether the user may read the media file called name"""
+        recipes = Recipe.objects.filter(
+            image__startswith=original_prefix(name)
+        )
+        if not self.request.user.is_staff:
+            recipes = recipes.filter(user=self.request.user)
+
+        return recipes.exists()
+
+    def get_file(self, name):
+        """Return the name, path and stat of the file to send"""
+        candidates = [name]
+        if accepts_webp(self.request) and webp_name(name) != name:
+            candidates.insert(0, webp_name(name))
+
+        for candidate in candidates:
+            path = safe_join(settings.MEDIA_ROOT, candidate)
+            try:
+                file_stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.S_ISREG(file_stat.st_mode):
+                return candidate, path, file_stat
+
+        raise Http404
+
+    def get(self, request, path):
+        name = posixpath.normpath(path).lstrip("/")
+        if not self.has_access(name):
+            raise Http404
+
+        name, full_path, file_stat = self.get_file(name)
+        if not was_modified_since(
+            request.META.get("HTTP_IF_MODIFIED_SINCE"), file_stat.st_mtime
+        ):
+            response = HttpResponseNotModified()
+        else:
+            content_type, _ = mimetypes.guess_type(full_path)
+            response = self.send_file(
+                name,
+                full_path,
+                file_stat.st_size,
+                content_type or "application/octet-stream",
+            )
+
+        response["Last-Modified"] = http_date(file_stat.st_mtime)
+        patch_vary_headers(response, ["Accept"])
+        # uploads are content-addressed, a name never changes content
+        patch_cache_control(
+            response, private=True, max_age=IMMUTABLE_MAX_AGE, immutable=True
+        )
+        return response
+
+    def send_file(self, name, full_path, size, content_type):
+        """Return a response that transfers the file"""
+        backend = settings.MEDIA_SENDFILE
+        if backend == "x-accel":
+            response = HttpResponse(content_type=content_type)
+            response["X-Accel-Redirect"] = quote(
+                f"{settings.MEDIA_ACCEL_PREFIX}{name}"
+            )
+            return response
+        if backend == "x-sendfile":
+            response = HttpResponse(content_type=content_type)
+            response["X-Sendfile"] = full_path
+            return response
+
+        try:
+            byte_range = parse_range(self.request.META.get("HTTP_RANGE"), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(
+                status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+            )
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+        if byte_range is None:
+            response = FileResponse(
+                open(full_path, "rb"), content_type=content_type
+            )
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = FileResponse(
+                FileRange(open(full_path, "rb"), start, length),
+                status=status.HTTP_206_PARTIAL_CONTENT,
+                content_type=content_type,
+            )
+            response["Content-Length"] = length
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        response["Accept-Ranges"] = "bytes"
+        return response
+
+
+class MetricsView(APIView):
+    """
+    Expose the request metrics of all workers in the Prometheus text
+    format, to staff users.
+    """
+
+    authentication_classes = [
+        CachedTokenAuthentication,
+        SignedTokenAuthentication,
+        SessionAuthentication,
+    ]
+    permission_classes = [IsAdminUser]
+    content_negotiation_class = IgnoreAcceptNegotiation
+
+    def get(self, request):
+        counters, histograms = metrics.store.collect()
+        return HttpResponse(
+            metrics.render_metrics(counters, histograms),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
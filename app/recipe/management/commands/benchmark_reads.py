@@ -0,0 +1,136 @@
+"""Django command to compare the recipe read paths"""
+
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from rest_framework.renderers import JSONRenderer
+
+from core.models import Ingredient, Recipe, Tag
+from recipe.rows import RowRenderer
+from recipe.serializers import RecipeSerializer
+from recipe.views import RecipeViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Time rendering recipe lists from model instances and from "
+        "values() rows, on generated recipes that are rolled back "
+        "afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", nargs="+", type=int, default=[1000, 10000]
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=3, help="Runs per path, best wins."
+        )
+        parser.add_argument(
+            "--items",
+            type=int,
+            default=3,
+            help="Tags and ingredients linked to each recipe.",
+        )
+
+    def populate(self, size, items):
+        """Create a user owning size recipes and return it"""
+        user = get_user_model().objects.create_user(
+            email=f"benchmark-{uuid.uuid4().hex}@example.com"
+        )
+        tags = Tag.objects.bulk_create(
+            [Tag(user=user, name=f"Tag {i}") for i in range(20)]
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            [Ingredient(user=user, name=f"Ingredient {i}") for i in range(20)]
+        )
+        recipes = Recipe.objects.bulk_create(
+            [
+                Recipe(
+                    user=user,
+                    title=f"Recipe {i}",
+                    time_minutes=i % 120,
+                    price=Decimal(i % 5000) / 100,
+                    link=f"https://example.com/{i}",
+                )
+                for i in range(size)
+            ]
+        )
+        Recipe.tags.through.objects.bulk_create(
+            [
+                Recipe.tags.through(
+                    recipe_id=recipe.pk, tag_id=tags[(i + n) % 20].pk
+                )
+                for i, recipe in enumerate(recipes)
+                for n in range(items)
+            ]
+        )
+        Recipe.ingredients.through.objects.bulk_create(
+            [
+                Recipe.ingredients.through(
+                    recipe_id=recipe.pk,
+                    ingredient_id=ingredients[(i + n) % 20].pk,
+                )
+                for i, recipe in enumerate(recipes)
+                for n in range(items)
+            ]
+        )
+        return user
+
+    def render_instances(self, user, view, columns):
+        queryset = (
+            Recipe.objects.filter(user=user)
+            .prefetch_related(*view.expandable.values())
+            .only(*columns)
+            .order_by("-id")
+        )
+        data = RecipeSerializer(queryset, many=True).data
+        return JSONRenderer().render(data)
+
+    def render_rows(self, user, columns):
+        rows = (
+            Recipe.objects.filter(user=user)
+            .values(*columns)
+            .order_by("-id")
+        )
+        data = RowRenderer(RecipeSerializer()).render(rows)
+        return JSONRenderer().render(data)
+
+    def best(self, repeat, func, *args):
+        """Return the output and the fastest of repeat runs of func"""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            output = func(*args)
+            timings.append(time.perf_counter() - started)
+
+        return output, min(timings)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        view = RecipeViewSet()
+        columns = view.get_columns(Recipe, RecipeSerializer().fields)
+        repeat = options["repeat"]
+
+        for size in options["sizes"]:
+            with transaction.atomic():
+                user = self.populate(size, options["items"])
+                expected, instances = self.best(
+                    repeat, self.render_instances, user, view, columns
+                )
+                output, rows = self.best(
+                    repeat, self.render_rows, user, columns
+                )
+                transaction.set_rollback(True)
+
+            if output != expected:
+                raise CommandError(f"{size} rows: the outputs differ")
+            self.stdout.write(
+                f"{size} rows: instances {instances * 1000:.1f} ms, "
+                f"values {rows * 1000:.1f} ms, "
+                f"{instances / rows:.1f}x faster"
+            )
@@ -0,0 +1,432 @@
+"""View mixins for the recipe API"""
+
+import hashlib
+from itertools import chain
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import BasePermission
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from core.timing import timed
+from recipe.rows import RowRenderer, UnsupportedField
+from recipe.sqljson import SQLObjectBuilder
+
+
+class ConditionalRequestMixin:
+    """
+    ETag and Last-Modified support for list, retrieve and update.
+    Lists are validated against the user's collection version and single
+    objects against their updated_at, both read with one narrow query, so
+    a matching If-None-Match is answered with 304 before any serializing.
+    PUT and PATCH honour If-Match and If-Unmodified-Since, checked and
+    saved in one transaction with the object's row locked.
+    """
+
+    def _make_etag(self, *parts):
+        """Return a strong ETag for the parts and the response media type"""
+        parts = (*parts, self.request.accepted_media_type)
+        digest = hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+        return quote_etag(digest)
+
+    def get_collection_validators(self):
+        """Return the ETag and Last-Modified of the user's collection"""
+        if hasattr(self, "_collection_validators"):
+            return self._collection_validators
+
+        user_id = self.request.user.pk
+        version, modified_at = (
+            get_user_model()
+            .objects.filter(pk=user_id)
+            .values_list("collection_version", "collection_modified_at")
+            .get()
+        )
+        # ?tags=1 and ?tags=2 are different representations
+        query = sorted(self.request.query_params.lists())
+        etag = self._make_etag(
+            self.basename, "list", user_id, version, modified_at, query
+        )
+        self._collection_validators = etag, modified_at
+        return self._collection_validators
+
+    def get_object_validators(self, lock=False):
+        """
+        Return the ETag and Last-Modified of the requested object, with
+        lock=True also holding its row until the transaction ends
+        """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        lookup = self.kwargs[lookup_url_kwarg]
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: lookup}
+        )
+        if lock:
+            queryset = queryset.select_for_update(of=("self",))
+        updated_at = queryset.values_list("updated_at", flat=True).first()
+        if updated_at is None:
+            return None, None
+
+        return self._make_etag(self.basename, lookup, updated_at), updated_at
+
+    def _evaluate_preconditions(self, etag, last_modified):
+        """Return a 304/412 response if a precondition applies"""
+        if etag is None:
+            return None
+
+        response = get_conditional_response(
+            self.request,
+            etag=etag,
+            last_modified=int(last_modified.timestamp()),
+        )
+        return self._set_validators(response, etag, last_modified)
+
+    def _set_validators(self, response, etag, last_modified):
+        """Add the ETag and Last-Modified headers to a response"""
+        if response is not None and etag is not None:
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified.timestamp())
+
+        return response
+
+    def list(self, request, *args, **kwargs):
+        etag, last_modified = self.get_collection_validators()
+        response = self._evaluate_preconditions(etag, last_modified)
+        if response is not None:
+            return response
+
+        response = super().list(request, *args, **kwargs)
+        return self._set_validators(response, etag, last_modified)
+
+    def retrieve(self, request, *args, **kwargs):
+        etag, last_modified = self.get_object_validators()
+        response = self._evaluate_preconditions(etag, last_modified)
+        if response is not None:
+            return response
+
+        response = super().retrieve(request, *args, **kwargs)
+        return self._set_validators(response, etag, last_modified)
+
+    def update(self, request, *args, **kwargs):
+        conditional = (
+            "HTTP_IF_MATCH" in request.META
+            or "HTTP_IF_UNMODIFIED_SINCE" in request.META
+        )
+        with transaction.atomic():
+            if conditional:
+                # a concurrent PUT waits here instead of passing the same
+                # check and overwriting this one
+                etag, last_modified = self.get_object_validators(lock=True)
+                response = self._evaluate_preconditions(etag, last_modified)
+                if response is not None:
+                    return response
+
+            response = super().update(request, *args, **kwargs)
+
+        etag, last_modified = self.get_object_validators()
+        return self._set_validators(response, etag, last_modified)
+
+
+class ResponseCacheMixin:
+    """
+    Cache rendered list responses per user, endpoint, query string and
+    origin.
+    Keys embed the collection ETag, so any write that bumps the user's
+    collection version makes old entries unreachable and they age out of
+    the LRU cache configured as settings.RESPONSE_CACHE.
+    Use together with ConditionalRequestMixin, which provides the version.
+    """
+
+    # the browsable API embeds per-request forms and tokens
+    uncached_formats = ["api"]
+
+    def get_response_cache_key(self):
+        """Return the cache key for the current list request"""
+        etag, _ = self.get_collection_validators()
+        query = sorted(self.request.query_params.lists())
+        # bodies carry absolute image and pagination URLs
+        origin = self.request.scheme, self.request.get_host()
+        digest = hashlib.sha256(
+            repr((etag, query, origin)).encode()
+        ).hexdigest()
+        return f"response:{self.basename}:{self.request.user.pk}:{digest}"
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format in self.uncached_formats:
+            return super().list(request, *args, **kwargs)
+
+        cache = caches[settings.RESPONSE_CACHE]
+        key = self.get_response_cache_key()
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        def store(rendered):
+            cache.set(key, (rendered.content, rendered["Content-Type"]))
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK and hasattr(
+            response, "add_post_render_callback"
+        ):
+            response.add_post_render_callback(store)
+
+        return response
+
+
+class SparseFieldsMixin:
+    """
+    Column projection for list and retrieve, plus ?fields= and ?expand=.
+    The columns to select are worked out from the fields of the active
+    serializer class, so columns no field renders, such as a description
+    the list serializer leaves out, are never fetched. fields narrows the
+    rendered fields further and expand picks the nested relations on top
+    of any named in fields. Only the requested relations are prefetched.
+    The serializer must accept a fields argument.
+    """
+
+    sparse_actions = ["list", "retrieve"]
+    # serializer fields that read columns other than their own name
+    field_columns = {}
+    # nested serializer fields and the relation prefetched for each
+    expandable = {}
+
+    def _split_param(self, name):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return None
+
+        return [item.strip() for item in value.split(",") if item.strip()]
+
+    def get_requested_fields(self):
+        """Return the names of the fields to render, None for all"""
+        if hasattr(self, "_requested_fields"):
+            return self._requested_fields
+
+        requested = None
+        fields = self._split_param("fields")
+        expand = self._split_param("expand")
+        if self.action in self.sparse_actions and (fields or expand):
+            available = list(self.get_serializer_class()().fields)
+            selected = set(fields or available)
+            if expand is not None:
+                unknown = set(expand) - set(self.expandable)
+                if unknown:
+                    raise ValidationError(
+                        {"expand": f"Unknown relations: {sorted(unknown)}"}
+                    )
+                # relations named in fields stay, others must be expanded
+                dropped = set(self.expandable) - set(fields or [])
+                selected = (selected - dropped) | set(expand)
+
+            unknown = selected - set(available)
+            if unknown:
+                raise ValidationError(
+                    {"fields": f"Unknown fields: {sorted(unknown)}"}
+                )
+            requested = [name for name in available if name in selected]
+
+        self._requested_fields = requested
+        return requested
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_requested_fields()
+        if fields is not None:
+            kwargs.setdefault("fields", fields)
+
+        return super().get_serializer(*args, **kwargs)
+
+    def get_columns(self, model, serializer_fields):
+        """
+        Return the concrete columns behind the serializer fields, or None
+        when a field reads something that cannot be mapped to a column.
+        """
+        concrete = {f.name for f in model._meta.concrete_fields}
+        columns = {"id"}
+        for name, field in serializer_fields.items():
+            if name in self.expandable:
+                continue
+            if name in self.field_columns:
+                columns.update(self.field_columns[name])
+                continue
+
+            source = field.source.split(".")[0]
+            if source not in concrete:
+                return None
+            columns.add(source)
+
+        return columns
+
+    def narrow_queryset(self, queryset):
+        """Select only the columns and relations the response needs"""
+        if self.action not in self.sparse_actions:
+            return queryset
+
+        serializer_fields = self.get_serializer_class()().fields
+        requested = self.get_requested_fields()
+        if requested is not None:
+            serializer_fields = {
+                name: serializer_fields[name] for name in requested
+            }
+
+        relations = [
+            relation
+            for name, relation in self.expandable.items()
+            if name in serializer_fields
+        ]
+        queryset = queryset.prefetch_related(None).prefetch_related(
+            *relations
+        )
+        columns = self.get_columns(queryset.model, serializer_fields)
+        if columns is None:
+            return queryset
+
+        return queryset.only(*columns)
+
+
+class SQLJSONListMixin:
+    """
+    Optionally have Postgres build list responses as JSON text.
+    With settings.RECIPE_LIST_SQL_JSON on, every object of the page is
+    rendered by a SQLObjectBuilder expression compiled from the active
+    serializer and the text Postgres returns is streamed to the client
+    without being decoded. Filters, search and cursor pagination apply as
+    usual. Only JSON responses take this path, and serializers the builder
+    cannot reproduce fall back to the regular list.
+    """
+
+    def iter_json(self, rows):
+        """Yield the JSON text of the rows as the items of an array"""
+        separator = ""
+        for row in rows:
+            yield separator
+            yield row["json_body"]
+            separator = ","
+
+    def iter_json_page(self, page):
+        """Yield a paginated response around the rows of a page"""
+        envelope = self.paginator.get_paginated_response([]).data
+        links = JSONRenderer().render(
+            {key: value for key, value in envelope.items() if key != "results"}
+        )
+        yield links.decode()[:-1] + ',"results":['
+        yield from self.iter_json(page)
+        yield "]}"
+
+    def list(self, request, *args, **kwargs):
+        if (
+            not settings.RECIPE_LIST_SQL_JSON
+            or request.accepted_renderer.format != "json"
+        ):
+            return super().list(request, *args, **kwargs)
+        try:
+            body = SQLObjectBuilder(self.get_serializer()).build()
+        except UnsupportedField:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        # the pagination reads its cursor position from the pk and rank
+        rows = queryset.prefetch_related(None).values(
+            queryset.model._meta.pk.name,
+            *queryset.query.annotations,
+            json_body=body,
+        )
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            content = self.iter_json_page(page)
+        else:
+            content = chain(["["], self.iter_json(rows.iterator()), ["]"])
+
+        return StreamingHttpResponse(
+            content, content_type="application/json; charset=utf-8"
+        )
+
+
+class ValuesReadMixin:
+    """
+    Serve list and retrieve from QuerySet.values() rows.
+    Rows are rendered by a RowRenderer compiled from the active serializer,
+    with nested relations read from their link tables, so no model
+    instance is built and the output is the same as the serializer's.
+    Serializers the renderer cannot reproduce, views with object
+    permissions and the browsable API take the regular path, as does
+    everything when settings.RECIPE_VALUES_READ is off.
+    Use together with SparseFieldsMixin, which provides the columns.
+    """
+
+    # the browsable API builds its forms from serializer instances
+    instance_formats = ["api"]
+
+    def get_row_renderer(self):
+        """Return the renderer and the columns to read, or None"""
+        if not settings.RECIPE_VALUES_READ:
+            return None
+        if self.request.accepted_renderer.format in self.instance_formats:
+            return None
+
+        serializer = self.get_serializer()
+        columns = self.get_columns(serializer.Meta.model, serializer.fields)
+        if columns is None:
+            return None
+        try:
+            return RowRenderer(serializer), columns
+        except UnsupportedField:
+            return None
+
+    def get_rows(self, columns):
+        """Return the filtered queryset as rows of the columns"""
+        queryset = self.filter_queryset(self.get_queryset())
+        # keep annotations such as the search rank the pagination orders by
+        return queryset.prefetch_related(None).values(
+            *columns, *queryset.query.annotations
+        )
+
+    def _checks_objects(self):
+        return any(
+            type(permission).has_object_permission
+            is not BasePermission.has_object_permission
+            for permission in self.get_permissions()
+        )
+
+    def list(self, request, *args, **kwargs):
+        compiled = self.get_row_renderer()
+        if compiled is None:
+            return super().list(request, *args, **kwargs)
+
+        renderer, columns = compiled
+        rows = self.get_rows(columns)
+        page = self.paginate_queryset(rows)
+        with timed(request, "serialize"):
+            data = renderer.render(rows if page is None else page)
+        if page is not None:
+            return self.get_paginated_response(data)
+
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        compiled = self.get_row_renderer()
+        if compiled is None or self._checks_objects():
+            return super().retrieve(request, *args, **kwargs)
+
+        renderer, columns = compiled
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        lookup = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        try:
+            row = self.get_rows(columns).filter(**lookup).first()
+        except (TypeError, ValueError, DjangoValidationError):
+            row = None
+        if row is None:
+            raise Http404
+
+        with timed(request, "serialize"):
+            data = renderer.render_one(row)
+
+        return Response(data)
@@ -0,0 +1,87 @@
+"""Renderers for recipe exports"""
+
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class Echo:
+    """A file-like object that hands back what is written to it"""
+
+    def write(self, value):
+        return value
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Render one JSON document per line.
+    render() handles whole responses such as errors, exports stream
+    through iter_rows() instead.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def iter_rows(self, rows):
+        """Yield each row as a line of JSON"""
+        for row in rows:
+            yield json.dumps(row, cls=JSONEncoder, ensure_ascii=False) + "\n"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        rows = data if isinstance(data, list) else [data]
+        return "".join(self.iter_rows(rows)).encode(self.charset)
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Render recipes as CSV, nested tags and ingredients joined by "; ".
+    render() handles whole responses such as errors, exports stream
+    through iter_rows() instead.
+    """
+
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+    header = [
+        "id",
+        "title",
+        "description",
+        "time_minutes",
+        "price",
+        "link",
+        "image",
+        "tags",
+        "ingredients",
+    ]
+    nested = ["tags", "ingredients"]
+
+    def get_row(self, data):
+        row = []
+        for field in self.header:
+            value = data.get(field)
+            if field in self.nested and value is not None:
+                value = "; ".join(item["name"] for item in value)
+            row.append("" if value is None else value)
+
+        return row
+
+    def iter_rows(self, rows):
+        """Yield the header line, then one line per row"""
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.header)
+        for data in rows:
+            yield writer.writerow(self.get_row(data))
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if not isinstance(data, list):
+            # errors have no recipe columns, keep them readable
+            return json.dumps(data, cls=JSONEncoder).encode(self.charset)
+
+        return "".join(self.iter_rows(data)).encode(self.charset)
@@ -0,0 +1,157 @@
+"""Render QuerySet.values() rows the way the recipe serializers do"""
+
+from django.core.exceptions import FieldDoesNotExist
+
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from core.timing import timed
+
+
+# fields whose to_representation returns a database value unchanged
+PASSTHROUGH_FIELDS = (serializers.IntegerField, serializers.CharField)
+# fields that render model instances rather than column values
+INSTANCE_FIELDS = (
+    serializers.BaseSerializer,
+    serializers.RelatedField,
+    serializers.ManyRelatedField,
+)
+
+
+class UnsupportedField(Exception):
+    """A serializer field cannot be rendered from a values() row"""
+
+
+class RowRenderer:
+    """
+    Render dict rows exactly as a model serializer renders instances.
+    Each readable field of the serializer is compiled once into a function
+    of the row, so rendering skips the per-field attribute lookups and
+    ordered dicts of Serializer.to_representation. Nested many=True fields
+    are read through their table of links with one query per relation,
+    ordered by id, and method fields call get_<name>_from_row() on the
+    serializer. Any other field that cannot be reproduced from a row
+    raises UnsupportedField when the renderer is built.
+    """
+
+    def __init__(self, serializer):
+        self.model = serializer.Meta.model
+        self.pk_name = self.model._meta.pk.name
+        self.context = serializer.context
+        self.nested = {}
+        self.getters = [
+            (field.field_name, self.compile(serializer, field))
+            for field in serializer._readable_fields
+        ]
+
+    def compile(self, serializer, field):
+        """Return a function rendering the field from a row"""
+        name = field.field_name
+        if isinstance(field, serializers.ListSerializer):
+            self.nested[name] = self.compile_nested(field)
+            return lambda row: row[name]
+        if isinstance(field, serializers.SerializerMethodField):
+            method_name = f"{field.method_name}_from_row"
+            method = getattr(serializer, method_name, None)
+            if method is None:
+                raise UnsupportedField(name)
+            return method
+
+        source = field.source
+        if (
+            isinstance(field, INSTANCE_FIELDS)
+            or source == "*"
+            or "." in source
+        ):
+            raise UnsupportedField(name)
+        if isinstance(field, serializers.FileField):
+            return self.compile_file(field)
+        if isinstance(field, PASSTHROUGH_FIELDS):
+            return lambda row: row[source]
+
+        to_representation = field.to_representation
+
+        def render(row):
+            value = row[source]
+            return None if value is None else to_representation(value)
+
+        return render
+
+    def compile_file(self, field):
+        """Return a function rendering a file field from its stored name"""
+        source = field.source
+        storage = self.model._meta.get_field(source).storage
+        request = self.context.get("request")
+        use_url = getattr(
+            field, "use_url", api_settings.UPLOADED_FILES_USE_URL
+        )
+
+        def render(row):
+            name = row[source]
+            if not name:
+                return None
+            if not use_url:
+                return name
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request else url
+
+        return render
+
+    def compile_nested(self, field):
+        """Return the query and keys that load a nested relation"""
+        try:
+            relation = self.model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            raise UnsupportedField(field.field_name)
+        if not relation.many_to_many or relation.auto_created:
+            raise UnsupportedField(field.field_name)
+
+        source = f"{relation.m2m_field_name()}_id"
+        target = relation.m2m_reverse_field_name()
+        target_pk = relation.related_model._meta.pk.name
+        columns = {}
+        for child_field in field.child._readable_fields:
+            child_source = child_field.source
+            if (
+                not isinstance(child_field, PASSTHROUGH_FIELDS)
+                or "." in child_source
+            ):
+                raise UnsupportedField(field.field_name)
+            columns[child_field.field_name] = (
+                f"{target}_id"
+                if child_source == target_pk
+                else f"{target}__{child_source}"
+            )
+
+        links = relation.remote_field.through.objects.order_by(
+            f"{target}_id"
+        ).values_list(source, *columns.values())
+        return source, list(columns), links
+
+    def load_nested(self, rows):
+        """Add the items of every nested relation to the rows"""
+        if not self.nested or not rows:
+            return
+
+        by_pk = {}
+        for row in rows:
+            by_pk[row[self.pk_name]] = row
+        with timed(self.context.get("request"), "serialize.nested"):
+            for name, (source, keys, links) in self.nested.items():
+                for row in rows:
+                    row[name] = []
+                for parent_pk, *values in links.filter(
+                    **{f"{source}__in": list(by_pk)}
+                ):
+                    by_pk[parent_pk][name].append(dict(zip(keys, values)))
+
+    def render(self, rows):
+        """Return the representation of each row"""
+        rows = list(rows)
+        self.load_nested(rows)
+        getters = self.getters
+        return [{name: get(row) for name, get in getters} for row in rows]
+
+    def render_one(self, row):
+        """Return the representation of a single row"""
+        return self.render([row])[0]
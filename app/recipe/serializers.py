@@ -1,26 +1,60 @@
 """Serializers for recipe API"""
 
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import (
+    Case,
+    CharField,
+    JSONField,
+    Value,
+    When,
+    prefetch_related_objects,
+)
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_field
+
 from rest_framework import serializers
 
+from core.images import variant_name
+from core.timing import TimedDataMixin, TimedListSerializer
+
 from core.models import Recipe, Tag, Ingredient
+from recipe.sqljson import JSONBuildObject, is_empty
+
+
+class DynamicFieldsMixin:
+    """Render only the fields named in the fields argument"""
 
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
-class TagSerializer(serializers.ModelSerializer):
+
+class TagSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for Tags"""
 
     class Meta:
         model = Tag
         fields = ["id", "name"]
         read_only_fields = ["id"]
+        list_serializer_class = TimedListSerializer
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for Ingredients"""
 
     class Meta:
         model = Ingredient
         fields = ["id", "name"]
         read_only_fields = ["id"]
+        list_serializer_class = TimedListSerializer
 
 
 class RecipeImageSerializer(serializers.ModelSerializer):
@@ -38,11 +72,109 @@ class RecipeImageSerializer(serializers.ModelSerializer):
         return value
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeListSerializer(TimedDataMixin, serializers.ListSerializer):
+    """
+    Create or update a batch of recipes.
+    Tags and ingredients are resolved for the whole batch with one lookup
+    and one insert per model, recipes are written with one bulk_create or
+    bulk_update and their links with one insert per relation. Images are
+    left alone, they are set through upload-image.
+    """
+
+    def _resolve(self, model, items_lists):
+        """Return a name to object map for the items of the whole batch"""
+        items = [item for items in items_lists if items for item in items]
+        objs = self.child._get_or_create(model, items)
+        return {obj.name: obj for obj in objs}
+
+    def _link(self, recipes, related_name, items_lists, model):
+        """Link each recipe to its items with one through-table insert"""
+        objs = self._resolve(model, items_lists)
+        field = getattr(Recipe, related_name)
+        through = field.through
+        target = field.field.m2m_reverse_field_name()
+        through.objects.bulk_create(
+            [
+                through(recipe_id=recipe.pk, **{target: objs[item["name"]]})
+                for recipe, items in zip(recipes, items_lists)
+                for item in items or []
+            ],
+            ignore_conflicts=True,
+        )
+
+    def _relink(self, recipes, related_name, items_lists, model):
+        """Replace the links of the recipes that were given new items"""
+        changed = [
+            (recipe, items)
+            for recipe, items in zip(recipes, items_lists)
+            if items is not None
+        ]
+        if not changed:
+            return
+
+        through = getattr(Recipe, related_name).through
+        through.objects.filter(
+            recipe_id__in=[recipe.pk for recipe, _ in changed]
+        ).delete()
+        recipes, items_lists = zip(*changed)
+        self._link(recipes, related_name, items_lists, model)
+
+    def _finish(self, recipes):
+        """Invalidate cached lists and load the links for the response"""
+        # bulk writes skip the signals that do this per row
+        user_id = self.context["request"].user.pk
+        get_user_model().objects.bump_collection_version(user_id)
+        prefetch_related_objects(recipes, "tags", "ingredients")
+
+    @transaction.atomic
+    def create(self, validated_data):
+        tags = []
+        ingredients = []
+        for attrs in validated_data:
+            attrs.pop("image", None)
+            tags.append(attrs.pop("tags", []))
+            ingredients.append(attrs.pop("ingredients", []))
+
+        recipes = Recipe.objects.bulk_create(
+            [Recipe(**attrs) for attrs in validated_data]
+        )
+        self._link(recipes, "tags", tags, Tag)
+        self._link(recipes, "ingredients", ingredients, Ingredient)
+        self._finish(recipes)
+
+        return recipes
+
+    @transaction.atomic
+    def update(self, instances, validated_data):
+        now = timezone.now()
+        fields = {"updated_at"}
+        tags = []
+        ingredients = []
+        for recipe, attrs in zip(instances, validated_data):
+            attrs.pop("image", None)
+            tags.append(attrs.pop("tags", None))
+            ingredients.append(attrs.pop("ingredients", None))
+            for attr, value in attrs.items():
+                setattr(recipe, attr, value)
+                fields.add(attr)
+            recipe.updated_at = now
+
+        Recipe.objects.bulk_update(instances, sorted(fields))
+        self._relink(instances, "tags", tags, Tag)
+        self._relink(instances, "ingredients", ingredients, Ingredient)
+        self._finish(instances)
+
+        return instances
+
+
+class RecipeSerializer(
+    TimedDataMixin, DynamicFieldsMixin, serializers.ModelSerializer
+):
     """Serializer for recipes"""
 
     tags = TagSerializer(many=True, required=False)
     ingredients = IngredientSerializer(many=True, required=False)
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -55,27 +187,112 @@ class RecipeSerializer(serializers.ModelSerializer):
             "tags",
             "ingredients",
             "image",
+            "image_variants",
         ]
         read_only_fields = ["id"]
+        list_serializer_class = RecipeListSerializer
 
-    def _get_or_create_tags(self, tags, recipe):
-        """Handle getting or creating tags"""
+    @extend_schema_field(OpenApiTypes.OBJECT)
+    def get_image_variants(self, recipe):
+        """
+        Return the URL of each resized variant of the image, falling back
+        to the original until the variant has been generated.
+        """
+        if not recipe.image:
+            return None
+
+        return self._variant_urls(recipe.image.name, recipe.image_variants)
+
+    def get_image_variants_from_row(self, row):
+        """Return the image variants of a row read with values()"""
+        if not row["image"]:
+            return None
+
+        return self._variant_urls(row["image"], row["image_variants"])
+
+    def get_image_variants_sql(self, url):
+        """Return the image variants as a SQL expression"""
+        storage = Recipe._meta.get_field("image").storage
+        # generated variants are recorded under their file names
+        urls = {
+            variant: url(
+                Coalesce(
+                    KeyTextTransform(variant, "image_variants"),
+                    "image",
+                    output_field=CharField(),
+                ),
+                storage,
+            )
+            for variant in settings.RECIPE_IMAGE_VARIANTS
+        }
+        return Case(
+            When(is_empty("image"), then=Value(None)),
+            default=JSONBuildObject(**urls),
+            output_field=JSONField(),
+        )
+
+    def _variant_urls(self, image, generated):
+        request = self.context.get("request")
+        storage = Recipe._meta.get_field("image").storage
+        urls = {}
+        for variant in settings.RECIPE_IMAGE_VARIANTS:
+            name = image
+            if variant in generated:
+                name = variant_name(name, variant)
+            url = storage.url(name)
+            urls[variant] = request.build_absolute_uri(url) if request else url
+
+        return urls
+
+    def _get_or_create(self, model, items):
+        """
+        Return objects for the named items, creating the missing ones.
+        Existing rows are fetched in one query and new rows are inserted
+        in one bulk insert, preserving the order names were given in.
+        """
         auth_user = self.context["request"].user
+        names = list(dict.fromkeys(item["name"] for item in items))
+        if not names:
+            return []
+
+        existing = {
+            obj.name: obj
+            for obj in model.objects.filter(user=auth_user, name__in=names)
+        }
+        missing = [
+            model(user=auth_user, name=name)
+            for name in names
+            if name not in existing
+        ]
+        for obj in model.objects.bulk_create(missing):
+            existing[obj.name] = obj
+
+        return [existing[name] for name in names]
 
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(user=auth_user, **tag)
-            recipe.tags.add(tag_obj)
+    def _add_related(self, recipe, related_name, objs):
+        """Link objects to a recipe with one through-table insert"""
+        if not objs:
+            return
+
+        field = getattr(Recipe, related_name)
+        through = field.through
+        target = field.field.m2m_reverse_field_name()
+        through.objects.bulk_create(
+            [through(recipe_id=recipe.pk, **{target: obj}) for obj in objs],
+            ignore_conflicts=True,
+        )
+
+    def _get_or_create_tags(self, tags, recipe):
+        """Handle getting or creating tags"""
+        tag_objs = self._get_or_create(Tag, tags)
+        self._add_related(recipe, "tags", tag_objs)
 
     def _get_or_create_ingredients(self, ingredients, recipe):
         """Handle getting or creating ingredients"""
-        auth_user = self.context["request"].user
-
-        for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(
-                user=auth_user, **ingredient
-            )
-            recipe.ingredients.add(ingredient_obj)
+        ingredient_objs = self._get_or_create(Ingredient, ingredients)
+        self._add_related(recipe, "ingredients", ingredient_objs)
 
+    @transaction.atomic
     def create(self, validated_data):
         """
         Create a recipe - nested serializer fields are read only
@@ -90,6 +307,7 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Update a recipe"""
         tags = validated_data.pop("tags", None)
@@ -118,3 +336,45 @@ class RecipeDetailSerializer(RecipeSerializer):
     class Meta(RecipeSerializer.Meta):
 
         fields = RecipeSerializer.Meta.fields + ["description"]
+
+
+class RecipeSearchSerializer(RecipeSerializer):
+    """Serializer for recipe search results with a highlighted snippet"""
+
+    snippet = serializers.CharField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ["snippet"]
+
+
+class RecipeImageResizeSerializer(serializers.Serializer):
+    """Serializer for the query parameters of a resized recipe image"""
+
+    w = serializers.IntegerField(
+        source="width",
+        required=False,
+        min_value=1,
+        max_value=settings.RECIPE_IMAGE_RESIZE_MAX,
+    )
+    h = serializers.IntegerField(
+        source="height",
+        required=False,
+        min_value=1,
+        max_value=settings.RECIPE_IMAGE_RESIZE_MAX,
+    )
+    fit = serializers.ChoiceField(
+        choices=["contain", "cover"], default="contain"
+    )
+
+    def validate(self, attrs):
+        width, height = attrs.get("width"), attrs.get("height")
+        if width is None and height is None:
+            raise serializers.ValidationError("Provide w, h or both.")
+        if attrs["fit"] == "cover" and (width is None or height is None):
+            raise serializers.ValidationError("fit=cover needs both w and h.")
+
+        # contain with a single side only bounds that side
+        unbounded = settings.RECIPE_IMAGE_RESIZE_MAX
+        attrs["width"] = width or unbounded
+        attrs["height"] = height or unbounded
+        return attrs
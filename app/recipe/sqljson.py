@@ -0,0 +1,164 @@
+"""Build the representation of recipes as JSON inside Postgres"""
+
+from django.contrib.postgres.aggregates.mixins import OrderableAggMixin
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files.storage import default_storage
+from django.db.models import (
+    Aggregate,
+    Case,
+    CharField,
+    F,
+    Func,
+    JSONField,
+    OuterRef,
+    Q,
+    Subquery,
+    TextField,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, Coalesce, Concat
+
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from recipe.rows import INSTANCE_FIELDS, PASSTHROUGH_FIELDS, UnsupportedField
+
+
+class JSONBuildObject(Func):
+    """json_build_object(), keeping the keys in the order given"""
+
+    function = "JSON_BUILD_OBJECT"
+    output_field = JSONField()
+
+    def __init__(self, **fields):
+        expressions = []
+        for key, value in fields.items():
+            expressions.extend((Value(key), value))
+        super().__init__(*expressions)
+
+
+class JSONAgg(OrderableAggMixin, Aggregate):
+    """json_agg() with an optional ORDER BY"""
+
+    function = "JSON_AGG"
+    template = "%(function)s(%(distinct)s%(expressions)s %(ordering)s)"
+    output_field = JSONField()
+
+
+def is_empty(source):
+    """Return a condition matching an unset file field"""
+    return Q(**{source: ""}) | Q(**{f"{source}__isnull": True})
+
+
+class SQLObjectBuilder:
+    """
+    Compile a model serializer into a json_build_object() expression.
+    Postgres then renders each object with the same keys and values as the
+    serializer: decimals as text, files as URLs and nested many=True
+    fields as json_agg() subqueries over their link tables, ordered by
+    id. Method fields call get_<name>_sql(url) on the serializer, where
+    url() turns an expression holding a stored file name into its URL.
+    Any other field raises UnsupportedField.
+    Stored names are content hashes, they are used in URLs unquoted.
+    """
+
+    def __init__(self, serializer):
+        self.model = serializer.Meta.model
+        self.request = serializer.context.get("request")
+        self.fields = {
+            field.field_name: self.compile(serializer, field)
+            for field in serializer._readable_fields
+        }
+
+    def url(self, name, storage=default_storage):
+        """Return an expression for the URL of a stored file name"""
+        prefix = storage.url("")
+        if self.request is not None:
+            prefix = self.request.build_absolute_uri(prefix)
+
+        return Concat(Value(prefix), name, output_field=CharField())
+
+    def compile(self, serializer, field):
+        """Return an expression rendering the field"""
+        name = field.field_name
+        if isinstance(field, serializers.ListSerializer):
+            return self.compile_nested(field)
+        if isinstance(field, serializers.SerializerMethodField):
+            method_name = f"{field.method_name}_sql"
+            method = getattr(serializer, method_name, None)
+            if method is None:
+                raise UnsupportedField(name)
+            return method(self.url)
+
+        source = field.source
+        if (
+            isinstance(field, INSTANCE_FIELDS)
+            or source == "*"
+            or "." in source
+        ):
+            raise UnsupportedField(name)
+        if isinstance(field, serializers.FileField):
+            use_url = getattr(
+                field, "use_url", api_settings.UPLOADED_FILES_USE_URL
+            )
+            storage = self.model._meta.get_field(source).storage
+            return Case(
+                When(is_empty(source), then=Value(None)),
+                default=self.url(F(source), storage) if use_url else F(source),
+                output_field=CharField(),
+            )
+        if isinstance(field, serializers.DecimalField):
+            # numeric columns print with their scale, as the field does
+            return Cast(F(source), TextField())
+        if isinstance(field, PASSTHROUGH_FIELDS):
+            return F(source)
+
+        raise UnsupportedField(name)
+
+    def compile_nested(self, field):
+        """Return a subquery aggregating the items of a relation"""
+        try:
+            relation = self.model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            raise UnsupportedField(field.field_name)
+        if not relation.many_to_many or relation.auto_created:
+            raise UnsupportedField(field.field_name)
+
+        source = relation.m2m_field_name()
+        target = relation.m2m_reverse_field_name()
+        target_pk = relation.related_model._meta.pk.name
+        item = {}
+        for child_field in field.child._readable_fields:
+            child_source = child_field.source
+            if (
+                not isinstance(child_field, PASSTHROUGH_FIELDS)
+                or "." in child_source
+            ):
+                raise UnsupportedField(field.field_name)
+            item[child_field.field_name] = F(
+                f"{target}_id"
+                if child_source == target_pk
+                else f"{target}__{child_source}"
+            )
+
+        items = (
+            relation.remote_field.through.objects.filter(
+                **{source: OuterRef("pk")}
+            )
+            .order_by()
+            .values(source)
+            .annotate(
+                items=JSONAgg(
+                    JSONBuildObject(**item), ordering=f"{target}_id"
+                )
+            )
+            .values("items")
+        )
+        return Coalesce(
+            Subquery(items), Value("[]"), output_field=JSONField()
+        )
+
+    def build(self):
+        """Return the object as an expression evaluating to JSON text"""
+        return Cast(JSONBuildObject(**self.fields), TextField())
@@ -0,0 +1,25 @@
+"""
+Test custom Django management commands of the recipe app
+"""
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.models import Recipe
+
+
+class BenchmarkReadsTests(TestCase):
+    """Test the read path benchmark"""
+
+    def test_benchmark_reads(self):
+        """Test both paths are timed and the data rolled back"""
+        out = StringIO()
+
+        call_command(
+            "benchmark_reads", "--sizes", "3", "--repeat", "1", stdout=out
+        )
+
+        self.assertIn("3 rows: instances", out.getvalue())
+        self.assertFalse(Recipe.objects.exists())
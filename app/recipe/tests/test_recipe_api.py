@@ -1,26 +1,42 @@
 """Tests for recipe API"""
 
+import csv
+import hashlib
+import json
+import re
 import tempfile
 import os
+import shutil
 from PIL import Image
 
 from decimal import Decimal
+from io import BytesIO
+from unittest.mock import ANY, patch
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Recipe, Tag, Ingredient
+from core.images import resized_cache_dir, variant_name, webp_name
+from core.models import ImageBlob, Recipe, Tag, Ingredient
 
+from recipe.pagination import RecipeCursorPagination
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
 )
 
 RECIPE_URL = reverse("recipe:recipe-list")
+EXPORT_URL = reverse("recipe:recipe-export")
+BULK_URL = reverse("recipe:recipe-bulk")
 
 
 def create_recipe(user, **params):
@@ -49,6 +65,11 @@ def image_upload_url(recipe_id):
     return reverse("recipe:recipe-upload-image", args=[recipe_id])
 
 
+def image_resize_url(recipe_id):
+    """Create and return a resized image URL"""
+    return reverse("recipe:recipe-image", args=[recipe_id])
+
+
 def create_user(**params):
     """Create and return a new user"""
     return get_user_model().objects.create_user(**params)
@@ -86,7 +107,7 @@ class PrivateRecipeAPITests(TestCase):
         recipes = Recipe.objects.all().order_by("-id")
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_recipe_list_limited_to_user(self):
         """Test that list of recipes is limited to authenticated user"""
@@ -101,7 +122,86 @@ class PrivateRecipeAPITests(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
+
+    def test_recipe_list_cursor_pagination(self):
+        """Test recipes are paged newest first using an opaque cursor"""
+        recipes = [
+            create_recipe(user=self.user, title=f"Recipe {i}")
+            for i in range(5)
+        ]
+
+        res = self.client.get(RECIPE_URL, {"page_size": 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data["previous"])
+        self.assertEqual(
+            [r["id"] for r in res.data["results"]],
+            [recipes[4].id, recipes[3].id],
+        )
+
+        res = self.client.get(res.data["next"])
+        self.assertEqual(
+            [r["id"] for r in res.data["results"]],
+            [recipes[2].id, recipes[1].id],
+        )
+
+        res = self.client.get(res.data["next"])
+        self.assertEqual(
+            [r["id"] for r in res.data["results"]], [recipes[0].id]
+        )
+        self.assertIsNone(res.data["next"])
+
+    @patch.object(RecipeCursorPagination, "max_page_size", 3)
+    def test_recipe_list_page_size_is_capped(self):
+        """Test clients cannot request pages above the server maximum"""
+        for i in range(5):
+            create_recipe(user=self.user, title=f"Recipe {i}")
+
+        res = self.client.get(RECIPE_URL, {"page_size": 100})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["results"]), 3)
+        self.assertIsNotNone(res.data["next"])
+
+    def test_list_recipes_query_count_is_constant(self):
+        """Test listing recipes with tags and ingredients is not N+1"""
+        for count in (1, 10):
+            for i in range(count):
+                recipe = create_recipe(user=self.user, title=f"Recipe {i}")
+                recipe.tags.add(
+                    Tag.objects.create(user=self.user, name=f"Tag {i}")
+                )
+                recipe.ingredients.add(
+                    Ingredient.objects.create(user=self.user, name=f"Ing {i}")
+                )
+
+            # collection version, recipes, tags and ingredients
+            with self.assertNumQueries(4):
+                res = self.client.get(RECIPE_URL)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            Recipe.objects.all().delete()
+
+    def test_recipe_detail_query_count(self):
+        """Test retrieving a recipe fetches nested objects in bulk"""
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(*[
+            Tag.objects.create(user=self.user, name=f"Tag {i}")
+            for i in range(5)
+        ])
+        recipe.ingredients.add(*[
+            Ingredient.objects.create(user=self.user, name=f"Ing {i}")
+            for i in range(5)
+        ])
+
+        # validators, recipe, tags and ingredients
+        with self.assertNumQueries(4):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["tags"]), 5)
+        self.assertEqual(len(res.data["ingredients"]), 5)
 
     def test_recipe_detail(self):
         """Test get recipe detail"""
@@ -298,6 +398,219 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(recipe.tags.count(), 0)
 
+    def test_create_recipe_query_count_independent_of_tags(self):
+        """Test creating a recipe runs the same statements for any size"""
+        Tag.objects.create(user=self.user, name="Existing")
+        Ingredient.objects.create(user=self.user, name="Existing")
+        counts = []
+        for size in (2, 30):
+            payload = {
+                "title": f"Recipe {size}",
+                "time_minutes": 10,
+                "price": Decimal("1.00"),
+                "tags": [{"name": "Existing"}]
+                + [{"name": f"Tag {size} {i}"} for i in range(size)],
+                "ingredients": [{"name": "Existing"}]
+                + [{"name": f"Ing {size} {i}"} for i in range(size)],
+            }
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.post(RECIPE_URL, payload, format="json")
+
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(len(res.data["tags"]), size + 1)
+            self.assertEqual(len(res.data["ingredients"]), size + 1)
+            counts.append(len(ctx.captured_queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_update_recipe_query_count_independent_of_tags(self):
+        """Test updating nested tags runs the same statements for any size"""
+        counts = []
+        for size in (2, 30):
+            recipe = create_recipe(user=self.user)
+            payload = {
+                "tags": [{"name": f"Tag {size} {i}"} for i in range(size)],
+                "ingredients": [
+                    {"name": f"Ing {size} {i}"} for i in range(size)
+                ],
+            }
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.patch(
+                    detail_url(recipe.id), payload, format="json"
+                )
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(recipe.tags.count(), size)
+            self.assertEqual(recipe.ingredients.count(), size)
+            counts.append(len(ctx.captured_queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_create_recipe_with_duplicate_tag_names(self):
+        """Test repeated tag names in a payload create a single tag"""
+        payload = {
+            "title": "Pancakes",
+            "time_minutes": 15,
+            "price": Decimal("2.00"),
+            "tags": [{"name": "Breakfast"}, {"name": "Breakfast"}],
+        }
+
+        res = self.client.post(RECIPE_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data["id"])
+        self.assertEqual(recipe.tags.count(), 1)
+        self.assertEqual(
+            Tag.objects.filter(user=self.user, name="Breakfast").count(), 1
+        )
+
+    def test_filter_by_tags(self):
+        """Test returning recipes with any of the given tags"""
+        r1 = create_recipe(user=self.user, title="Thai curry")
+        r2 = create_recipe(user=self.user, title="Aubergine tahini")
+        r3 = create_recipe(user=self.user, title="Fish and chips")
+        tag1 = Tag.objects.create(user=self.user, name="Vegan")
+        tag2 = Tag.objects.create(user=self.user, name="Vegetarian")
+        r1.tags.add(tag1)
+        r2.tags.add(tag2)
+
+        res = self.client.get(RECIPE_URL, {"tags": f"{tag1.id},{tag2.id}"})
+
+        ids = [r["id"] for r in res.data["results"]]
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertCountEqual(ids, [r1.id, r2.id])
+        self.assertNotIn(r3.id, ids)
+
+    def test_filter_by_ingredients(self):
+        """Test returning recipes with specific ingredients"""
+        r1 = create_recipe(user=self.user, title="Posh beans on toast")
+        r2 = create_recipe(user=self.user, title="Chicken cacciatore")
+        r3 = create_recipe(user=self.user, title="Red lentil dal")
+        in1 = Ingredient.objects.create(user=self.user, name="Feta cheese")
+        in2 = Ingredient.objects.create(user=self.user, name="Chicken")
+        r1.ingredients.add(in1)
+        r2.ingredients.add(in2)
+
+        res = self.client.get(
+            RECIPE_URL, {"ingredients": f"{in1.id},{in2.id}"}
+        )
+
+        ids = [r["id"] for r in res.data["results"]]
+        self.assertCountEqual(ids, [r1.id, r2.id])
+        self.assertNotIn(r3.id, ids)
+
+    def test_filter_match_all_tags(self):
+        """Test match=all only returns recipes with every given tag"""
+        r1 = create_recipe(user=self.user, title="Vegan curry")
+        r2 = create_recipe(user=self.user, title="Curry")
+        tag1 = Tag.objects.create(user=self.user, name="Vegan")
+        tag2 = Tag.objects.create(user=self.user, name="Spicy")
+        r1.tags.add(tag1, tag2)
+        r2.tags.add(tag2)
+
+        res = self.client.get(
+            RECIPE_URL, {"tags": f"{tag1.id},{tag2.id}", "match": "all"}
+        )
+
+        ids = [r["id"] for r in res.data["results"]]
+        self.assertEqual(ids, [r1.id])
+
+    def test_filter_does_not_duplicate_recipes(self):
+        """Test a recipe matching several tags is returned once"""
+        recipe = create_recipe(user=self.user)
+        tag1 = Tag.objects.create(user=self.user, name="Quick")
+        tag2 = Tag.objects.create(user=self.user, name="Easy")
+        ingredient = Ingredient.objects.create(user=self.user, name="Egg")
+        recipe.tags.add(tag1, tag2)
+        recipe.ingredients.add(ingredient)
+
+        res = self.client.get(
+            RECIPE_URL,
+            {"tags": f"{tag1.id},{tag2.id}", "ingredients": ingredient.id},
+        )
+
+        ids = [r["id"] for r in res.data["results"]]
+        self.assertEqual(ids, [recipe.id])
+
+    def test_filter_invalid_ids_returns_error(self):
+        """Test non-numeric filter ids are rejected"""
+        res = self.client.get(RECIPE_URL, {"tags": "1,abc"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filters_skip_detail(self):
+        """Test filter params do not hide a recipe from detail views"""
+        recipe = create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+
+        res = self.client.get(detail_url(recipe.id), {"tags": tag.id})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_search_recipes_ranked_by_relevance(self):
+        """Test search matches title and description, best match first"""
+        r1 = create_recipe(
+            user=self.user,
+            title="Dinner party",
+            description="A lemon tart to finish",
+        )
+        r2 = create_recipe(
+            user=self.user,
+            title="Lemon drizzle cake",
+            description="Bake a lemon sponge and soak it in lemon syrup",
+        )
+        create_recipe(user=self.user, title="Beef stew", description="Slow")
+
+        res = self.client.get(RECIPE_URL, {"search": "lemons"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [r["id"] for r in res.data["results"]]
+        self.assertEqual(ids, [r2.id, r1.id])
+        self.assertNotIn("snippet", res.data["results"][0])
+
+    def test_search_with_highlight(self):
+        """Test search results can include a highlighted snippet"""
+        create_recipe(
+            user=self.user, title="Soup", description="Roast the tomatoes"
+        )
+
+        res = self.client.get(
+            RECIPE_URL, {"search": "tomato", "highlight": "true"}
+        )
+
+        self.assertEqual(len(res.data["results"]), 1)
+        snippet = res.data["results"][0]["snippet"]
+        self.assertIn("<mark>tomatoes</mark>", snippet)
+
+    def test_search_is_paginated(self):
+        """Test paging through search results returns every match once"""
+        for i in range(5):
+            create_recipe(
+                user=self.user,
+                title=f"Curry {i}",
+                description="curry " * i,
+            )
+
+        seen = []
+        res = self.client.get(RECIPE_URL, {"search": "curry", "page_size": 2})
+        while True:
+            seen.extend(r["id"] for r in res.data["results"])
+            if not res.data["next"]:
+                break
+            res = self.client.get(res.data["next"])
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_search_limited_to_user(self):
+        """Test search never returns other users' recipes"""
+        other_user = create_user(email="other@example.com", password="pw1234")
+        create_recipe(user=other_user, title="Pizza")
+
+        res = self.client.get(RECIPE_URL, {"search": "pizza"})
+
+        self.assertEqual(res.data["results"], [])
+
     def test_create_recipe_with_new_ingredients(self):
         """Test creating a recipe with new ingredients"""
 
@@ -388,6 +701,733 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(recipe.ingredients.count(), 0)
 
 
+class SparseFieldsTests(TestCase):
+    """Tests for ?fields= and ?expand= on recipe endpoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com")
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user, description="Long text")
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name="Vegan"))
+        self.recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name="Kale")
+        )
+
+    def _recipe_query(self, ctx):
+        """Return the SQL that loaded the recipes"""
+        # retrieve reads updated_at for its validators first
+        return [
+            q["sql"]
+            for q in ctx.captured_queries
+            if 'FROM "core_recipe"' in q["sql"]
+        ][-1]
+
+    def _selected_columns(self, ctx):
+        """Return the recipe columns in the SELECT list of the query"""
+        sql = self._recipe_query(ctx)
+        select = sql[: sql.index(' FROM "core_recipe"')]
+        # drop expressions such as the search rank, which read columns
+        # without selecting them
+        while True:
+            stripped = re.sub(r"\([^()]*\)", "", select)
+            if stripped == select:
+                break
+            select = stripped
+        return set(re.findall(r'"core_recipe"\."(\w+)"', select))
+
+    def test_list_fields(self):
+        """Test only the requested columns are selected and rendered"""
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(RECIPE_URL, {"fields": "id,title"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data["results"],
+            [{"id": self.recipe.id, "title": self.recipe.title}],
+        )
+        # collection version and recipes, no prefetches
+        self.assertEqual(len(ctx), 2)
+        sql = self._recipe_query(ctx)
+        self.assertIn('"core_recipe"."title"', sql)
+        self.assertNotIn('"core_recipe"."link"', sql)
+        self.assertNotIn('"core_recipe"."description"', sql)
+
+    def test_list_never_selects_description(self):
+        """Test list responses never fetch columns they do not render"""
+        for params in [{}, {"search": "sample"}]:
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.get(RECIPE_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            columns = self._selected_columns(ctx)
+            self.assertIn("title", columns)
+            for column in ["description", "search_vector", "updated_at"]:
+                self.assertNotIn(column, columns)
+
+    def test_detail_selects_description(self):
+        """Test the detail serializer's columns are all fetched"""
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(res.data["description"], "Long text")
+        sql = self._recipe_query(ctx)
+        self.assertIn('"core_recipe"."description"', sql)
+        self.assertNotIn('"core_recipe"."search_vector"', sql)
+
+    def test_list_expand(self):
+        """Test only the expanded relations are prefetched"""
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(RECIPE_URL, {"expand": "tags"})
+
+        item = res.data["results"][0]
+        self.assertEqual(item["tags"][0]["name"], "Vegan")
+        self.assertNotIn("ingredients", item)
+        self.assertIn("title", item)
+        # collection version, recipes and tags
+        self.assertEqual(len(ctx), 3)
+
+    def test_list_fields_and_expand(self):
+        """Test expanded relations are added to the requested fields"""
+        res = self.client.get(
+            RECIPE_URL, {"fields": "id", "expand": "ingredients"}
+        )
+
+        item = res.data["results"][0]
+        self.assertEqual(set(item), {"id", "ingredients"})
+
+    def test_list_fields_relation_and_expand(self):
+        """Test relations named in fields are kept alongside expand"""
+        res = self.client.get(
+            RECIPE_URL, {"fields": "id,tags", "expand": "ingredients"}
+        )
+
+        item = res.data["results"][0]
+        self.assertEqual(set(item), {"id", "tags", "ingredients"})
+
+    def test_list_image_variants_field(self):
+        """Test fields computed from other columns still load them"""
+        res = self.client.get(RECIPE_URL, {"fields": "id,image_variants"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data["results"][0]["image_variants"])
+
+    def test_detail_fields(self):
+        """Test sparse fields on a single recipe"""
+        res = self.client.get(
+            detail_url(self.recipe.id), {"fields": "id,description"}
+        )
+
+        self.assertEqual(
+            res.data, {"id": self.recipe.id, "description": "Long text"}
+        )
+
+    def test_unknown_fields(self):
+        """Test unknown fields and relations are rejected"""
+        for params in [{"fields": "id,secret"}, {"expand": "user"}]:
+            res = self.client.get(RECIPE_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ValuesReadTests(TestCase):
+    """Test list and retrieve served from values() rows"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com")
+        self.client.force_authenticate(self.user)
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ["Vegan", "Dessert", "Quick"]
+        ]
+        kale = Ingredient.objects.create(user=self.user, name="Kale")
+        for i in range(3):
+            recipe = create_recipe(
+                user=self.user,
+                title=f"Sample recipe {i}",
+                price=Decimal("4.5"),
+            )
+            recipe.tags.add(*reversed(tags))
+            recipe.ingredients.add(kale)
+        name = "uploads/recipe/ab/abcdef.png"
+        Recipe.objects.filter(pk=recipe.pk).update(
+            image=name, image_variants={"thumb": variant_name(name, "thumb")}
+        )
+        self.recipe = recipe
+
+    def _get_both(self, url, params=None):
+        """Return the responses of the values() and the instance paths"""
+        responses = []
+        for enabled in [True, False]:
+            caches[settings.RESPONSE_CACHE].clear()
+            with self.settings(RECIPE_VALUES_READ=enabled):
+                res = self.client.get(url, params or {})
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            responses.append(res)
+
+        return responses
+
+    def test_list_identical(self):
+        """Test list responses are byte for byte the same on both paths"""
+        cases = [
+            {},
+            {"page_size": 2},
+            {"fields": "id,price,image", "expand": "tags"},
+            {"search": "sample", "highlight": "true"},
+        ]
+        for params in cases:
+            rows, instances = self._get_both(RECIPE_URL, params)
+            self.assertEqual(rows.content, instances.content, params)
+
+    def test_detail_identical(self):
+        """Test detail responses are byte for byte the same on both paths"""
+        rows, instances = self._get_both(detail_url(self.recipe.id))
+
+        self.assertEqual(rows.content, instances.content)
+        self.assertTrue(rows.data["image"].startswith("http://testserver/"))
+        self.assertEqual(rows.data["price"], "4.50")
+
+    def test_nested_ordered_by_id(self):
+        """Test nested items are listed in id order"""
+        res = self.client.get(detail_url(self.recipe.id))
+
+        names = [tag["name"] for tag in res.data["tags"]]
+        self.assertEqual(names, ["Vegan", "Dessert", "Quick"])
+
+    def test_list_queries(self):
+        """Test nested relations are read with one query each"""
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(RECIPE_URL)
+
+        # collection version, recipes, tags and ingredients
+        self.assertEqual(len(ctx), 4)
+
+    def test_detail_of_other_user(self):
+        """Test other users' recipes are not found"""
+        other = create_user(email="other@example.com")
+        recipe = create_recipe(user=other)
+
+        res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(RECIPE_LIST_SQL_JSON=True)
+class SQLJSONListTests(TestCase):
+    """Test recipe lists built as JSON by Postgres"""
+
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE].clear()
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com")
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name="Vegan")
+        kale = Ingredient.objects.create(user=self.user, name="Kale")
+        for i in range(3):
+            recipe = create_recipe(user=self.user, title=f"Sample {i}")
+            recipe.tags.add(self.tag)
+            recipe.ingredients.add(kale)
+        create_recipe(user=self.user, title="Plain", price=None)
+        name = "uploads/recipe/ab/abcdef.png"
+        Recipe.objects.filter(pk=recipe.pk).update(
+            image=name, image_variants={"thumb": variant_name(name, "thumb")}
+        )
+
+    def test_matches_serializer(self):
+        """Test the documents equal the serializer's, page links included"""
+        cases = [
+            {},
+            {"page_size": 2},
+            {"tags": str(self.tag.id)},
+            {"search": "sample", "highlight": "true"},
+            {"fields": "id,price,image_variants", "expand": "ingredients"},
+        ]
+        for params in cases:
+            res = self.client.get(RECIPE_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertTrue(res.streaming)
+            data = json.loads(b"".join(res.streaming_content))
+
+            with self.settings(RECIPE_LIST_SQL_JSON=False):
+                caches[settings.RESPONSE_CACHE].clear()
+                expected = self.client.get(RECIPE_URL, params).json()
+
+            self.assertEqual(data, expected, params)
+
+    def test_browsable_api_not_affected(self):
+        """Test only JSON responses are built by Postgres"""
+        res = self.client.get(RECIPE_URL, HTTP_ACCEPT="text/html")
+
+        self.assertFalse(res.streaming)
+
+
+class ConditionalRequestTests(TestCase):
+    """Test ETag and Last-Modified handling on recipe endpoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email="test@example.com", password="password123"
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_list_not_modified(self):
+        """Test a matching If-None-Match on the list returns 304"""
+        create_recipe(user=self.user)
+        res = self.client.get(RECIPE_URL)
+        etag = res["ETag"]
+        self.assertIn("Last-Modified", res)
+
+        # version lookup only, nothing is serialized
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res["ETag"], etag)
+        self.assertEqual(res.content, b"")
+
+    def test_list_etag_changes_on_write(self):
+        """Test creating, editing or relinking recipes changes the ETag"""
+        recipe = create_recipe(user=self.user)
+        etag = self.client.get(RECIPE_URL)["ETag"]
+
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        recipe.tags.add(tag)
+        res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["ETag"], etag)
+
+    def test_list_etag_varies_with_query(self):
+        """Test filtered lists do not share one ETag"""
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        create_recipe(user=self.user).tags.add(tag)
+        etag = self.client.get(RECIPE_URL, {"tags": tag.id})["ETag"]
+
+        res = self.client.get(
+            RECIPE_URL, {"tags": tag.id + 1}, HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["ETag"], etag)
+
+    def test_detail_not_modified(self):
+        """Test a matching If-None-Match on a recipe returns 304"""
+        recipe = create_recipe(user=self.user)
+        url = detail_url(recipe.id)
+        etag = self.client.get(url)["ETag"]
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_etag_changes_when_tag_renamed(self):
+        """Test renaming a linked tag invalidates the recipe ETag"""
+        recipe = create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        recipe.tags.add(tag)
+        url = detail_url(recipe.id)
+        etag = self.client.get(url)["ETag"]
+
+        tag.name = "Plant based"
+        tag.save()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["tags"][0]["name"], "Plant based")
+
+    def test_update_with_stale_if_match_fails(self):
+        """Test a PATCH with an outdated If-Match is rejected"""
+        recipe = create_recipe(user=self.user, title="Original")
+        url = detail_url(recipe.id)
+        etag = self.client.get(url)["ETag"]
+        self.client.patch(url, {"title": "First edit"})
+
+        res = self.client.patch(url, {"title": "Lost"}, HTTP_IF_MATCH=etag)
+
+        self.assertEqual(
+            res.status_code, status.HTTP_412_PRECONDITION_FAILED
+        )
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, "First edit")
+
+    def test_update_with_current_if_match(self):
+        """Test a PATCH with the current If-Match succeeds"""
+        recipe = create_recipe(user=self.user, title="Original")
+        url = detail_url(recipe.id)
+        etag = self.client.get(url)["ETag"]
+
+        res = self.client.patch(url, {"title": "Edited"}, HTTP_IF_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["ETag"], etag)
+        self.assertEqual(self.client.get(url)["ETag"], res["ETag"])
+
+    def test_update_if_match_locks_the_row(self):
+        """Test the If-Match check reads the recipe FOR UPDATE"""
+        recipe = create_recipe(user=self.user)
+        url = detail_url(recipe.id)
+        etag = self.client.get(url)["ETag"]
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.patch(url, {"title": "Edited"}, HTTP_IF_MATCH=etag)
+
+        self.assertTrue(
+            any("FOR UPDATE" in query["sql"] for query in ctx.captured_queries)
+        )
+
+
+class ResponseCacheTests(TestCase):
+    """Test the per-user list response cache"""
+
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE].clear()
+        self.client = APIClient()
+        self.user = create_user(
+            email="test@example.com", password="password123"
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_repeat_list_served_from_cache(self):
+        """Test an unchanged list is served without querying recipes"""
+        create_recipe(user=self.user)
+        res = self.client.get(RECIPE_URL, {"page_size": 10})
+
+        # only the collection version is read
+        with self.assertNumQueries(1):
+            cached = self.client.get(RECIPE_URL, {"page_size": 10})
+
+        self.assertEqual(cached.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached.content, res.content)
+        self.assertEqual(cached["ETag"], res["ETag"])
+
+    def test_cache_keyed_by_query_string(self):
+        """Test different query strings are cached separately"""
+        r1 = create_recipe(user=self.user, title="Soup")
+        create_recipe(user=self.user, title="Salad")
+        tag = Tag.objects.create(user=self.user, name="Starter")
+        r1.tags.add(tag)
+        self.client.get(RECIPE_URL)
+
+        res = self.client.get(RECIPE_URL, {"tags": tag.id})
+
+        self.assertEqual(len(res.json()["results"]), 1)
+
+    @override_settings(ALLOWED_HOSTS=["a.example.com", "b.example.com"])
+    def test_cache_keyed_by_origin(self):
+        """Test absolute links are never served to another host or scheme"""
+        create_recipe(user=self.user)
+        create_recipe(user=self.user)
+        params = {"page_size": 1}
+        self.client.get(RECIPE_URL, params, HTTP_HOST="a.example.com")
+
+        res = self.client.get(RECIPE_URL, params, HTTP_HOST="b.example.com")
+        secure = self.client.get(
+            RECIPE_URL, params, HTTP_HOST="b.example.com", secure=True
+        )
+
+        self.assertTrue(
+            res.json()["next"].startswith("http://b.example.com/")
+        )
+        self.assertTrue(
+            secure.json()["next"].startswith("https://b.example.com/")
+        )
+
+    def test_cache_invalidated_by_nested_update(self):
+        """Test updating a recipe's tags is visible on the next list"""
+        recipe = create_recipe(user=self.user)
+        self.client.get(RECIPE_URL)
+
+        payload = {"tags": [{"name": "Lunch"}]}
+        self.client.patch(detail_url(recipe.id), payload, format="json")
+        res = self.client.get(RECIPE_URL)
+
+        tags = res.json()["results"][0]["tags"]
+        self.assertEqual([t["name"] for t in tags], ["Lunch"])
+
+    def test_cache_not_shared_between_users(self):
+        """Test a cached list is never served to another user"""
+        create_recipe(user=self.user)
+        self.client.get(RECIPE_URL)
+
+        other_user = create_user(email="other@example.com", password="pw1234")
+        self.client.force_authenticate(other_user)
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.json()["results"], [])
+
+
+class ExportTests(TestCase):
+    """Tests for the streaming recipe export"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com")
+        self.client.force_authenticate(self.user)
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        ingredient = Ingredient.objects.create(user=self.user, name="Kale")
+        self.recipes = []
+        for i in range(5):
+            recipe = create_recipe(user=self.user, title=f"Recipe {i}")
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+            self.recipes.append(recipe)
+        create_recipe(user=create_user(email="other@example.com"))
+
+    def _export(self, **params):
+        res = self.client.get(EXPORT_URL, params)
+        content = b"".join(res.streaming_content).decode()
+        return res, content
+
+    @override_settings(RECIPE_EXPORT_CHUNK_SIZE=2)
+    def test_export_ndjson(self):
+        """Test exporting every recipe of the user as NDJSON"""
+        res, content = self._export()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res["Content-Type"].startswith("application/x-ndjson"))
+        self.assertIn("attachment", res["Content-Disposition"])
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(
+            [row["id"] for row in rows], [r.id for r in self.recipes]
+        )
+        for row in rows:
+            self.assertEqual(row["tags"][0]["name"], "Vegan")
+            self.assertEqual(row["ingredients"][0]["name"], "Kale")
+            self.assertIn("description", row)
+
+    @override_settings(RECIPE_EXPORT_CHUNK_SIZE=2)
+    def test_export_csv(self):
+        """Test exporting every recipe of the user as CSV"""
+        res, content = self._export(format="csv")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res["Content-Type"].startswith("text/csv"))
+        rows = list(csv.DictReader(content.splitlines()))
+        self.assertEqual(
+            [int(row["id"]) for row in rows], [r.id for r in self.recipes]
+        )
+        self.assertEqual(rows[0]["title"], "Recipe 0")
+        self.assertEqual(rows[0]["tags"], "Vegan")
+        self.assertEqual(rows[0]["ingredients"], "Kale")
+
+    def test_export_filtered(self):
+        """Test the list filters apply to the export"""
+        tag = Tag.objects.create(user=self.user, name="Quick")
+        self.recipes[0].tags.add(tag)
+
+        _, content = self._export(tags=str(tag.id))
+
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row["id"] for row in rows], [self.recipes[0].id])
+
+    def test_export_unknown_format(self):
+        """Test formats other than ndjson and csv are not found"""
+        res = self.client.get(EXPORT_URL, {"format": "xml"})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BulkTests(TestCase):
+    """Tests for the bulk recipe API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com")
+        self.client.force_authenticate(self.user)
+
+    def _payload(self, count):
+        return [
+            {
+                "title": f"Recipe {i}",
+                "time_minutes": 10,
+                "price": "5.00",
+                "tags": [{"name": "Vegan"}, {"name": f"Tag {i}"}],
+                "ingredients": [{"name": "Kale"}],
+            }
+            for i in range(count)
+        ]
+
+    def test_bulk_create(self):
+        """Test creating a batch of recipes"""
+        Tag.objects.create(user=self.user, name="Vegan")
+
+        res = self.client.post(BULK_URL, self._payload(3), format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data), 3)
+        recipes = Recipe.objects.filter(user=self.user).order_by("id")
+        self.assertEqual([r.id for r in recipes], [r["id"] for r in res.data])
+        self.assertEqual(Tag.objects.filter(name="Vegan").count(), 1)
+        self.assertEqual(Ingredient.objects.count(), 1)
+        for recipe, data in zip(recipes, res.data):
+            self.assertEqual(recipe.tags.count(), 2)
+            self.assertEqual(
+                sorted(tag["name"] for tag in data["tags"]),
+                sorted(tag.name for tag in recipe.tags.all()),
+            )
+
+    def test_bulk_create_query_count_is_constant(self):
+        """Test the number of queries does not grow with the batch"""
+        # both batches then insert only their new tags
+        Tag.objects.create(user=self.user, name="Vegan")
+        Ingredient.objects.create(user=self.user, name="Kale")
+
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(BULK_URL, self._payload(2), format="json")
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(BULK_URL, self._payload(20), format="json")
+
+        self.assertEqual(len(small), len(large))
+
+    def test_bulk_create_invalid_item(self):
+        """Test one invalid item rejects the whole batch"""
+        payload = self._payload(2)
+        del payload[1]["time_minutes"]
+
+        res = self.client.post(BULK_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn("time_minutes", res.data[1])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_update(self):
+        """Test partially updating a batch of recipes"""
+        recipe1 = create_recipe(user=self.user, title="One")
+        recipe2 = create_recipe(user=self.user, title="Two")
+        recipe2.tags.add(Tag.objects.create(user=self.user, name="Old"))
+        payload = [
+            {"id": recipe1.id, "title": "First"},
+            {"id": recipe2.id, "tags": [{"name": "New"}]},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe1.refresh_from_db()
+        recipe2.refresh_from_db()
+        self.assertEqual(recipe1.title, "First")
+        self.assertEqual(recipe2.title, "Two")
+        self.assertEqual([tag.name for tag in recipe2.tags.all()], ["New"])
+        self.assertEqual(res.data[1]["tags"], [{"id": ANY, "name": "New"}])
+
+    def test_bulk_update_other_users_recipe(self):
+        """Test batches naming other users' recipes are rejected"""
+        recipe = create_recipe(user=self.user, title="Mine")
+        other = create_recipe(user=create_user(email="other@example.com"))
+        payload = [
+            {"id": recipe.id, "title": "Changed"},
+            {"id": other.id, "title": "Changed"},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn("id", res.data[1])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, "Mine")
+
+    def test_bulk_delete(self):
+        """Test deleting a batch of recipes"""
+        recipes = [create_recipe(user=self.user) for _ in range(3)]
+        ids = [recipe.id for recipe in recipes[:2]]
+
+        res = self.client.delete(BULK_URL, ids, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(item["id"] for item in res.data), sorted(ids)
+        )
+        remaining = Recipe.objects.values_list("id", flat=True)
+        self.assertEqual(list(remaining), [recipes[2].id])
+
+    def test_bulk_delete_unknown_id(self):
+        """Test unknown ids reject the whole batch"""
+        recipe = create_recipe(user=self.user)
+
+        res = self.client.delete(
+            BULK_URL, [recipe.id, recipe.id + 100], format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+
+    def test_bulk_delete_duplicate_id(self):
+        """Test an id given twice rejects the batch"""
+        recipe = create_recipe(user=self.user)
+
+        res = self.client.delete(
+            BULK_URL, [recipe.id, recipe.id], format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[1], {"id": ["Duplicate id."]})
+        self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+
+    def test_bulk_invalid_ids(self):
+        """Test ids that are not integers are errors, not server errors"""
+        recipe = create_recipe(user=self.user)
+
+        res_delete = self.client.delete(
+            BULK_URL, [recipe.id, {"id": recipe.id}, True], format="json"
+        )
+        res_update = self.client.patch(
+            BULK_URL, [{"id": [recipe.id]}], format="json"
+        )
+
+        self.assertEqual(res_delete.status_code, status.HTTP_400_BAD_REQUEST)
+        error = {"id": ["A valid integer is required."]}
+        self.assertEqual(res_delete.data, [{}, error, error])
+        self.assertEqual(res_update.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res_update.data, [error])
+
+    def test_bulk_delete_releases_once(self):
+        """Test a batch cascades to links and releases images once"""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            recipes = [create_recipe(user=self.user) for _ in range(2)]
+            for recipe in recipes:
+                recipe.image.save("photo.jpg", ContentFile(b"image"))
+            recipes[0].tags.add(Tag.objects.create(user=self.user, name="A"))
+            self.user.refresh_from_db()
+            version = self.user.collection_version
+
+            res = self.client.delete(
+                BULK_URL, [recipe.id for recipe in recipes], format="json"
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(Recipe.tags.through.objects.exists())
+        self.assertTrue(Tag.objects.filter(name="A").exists())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.collection_version, version + 1)
+        blob = ImageBlob.objects.get(name=recipes[0].image.name)
+        self.assertEqual(blob.refcount, 0)
+        self.assertIsNotNone(blob.unreferenced_at)
+
+    def test_bulk_requires_list(self):
+        """Test the payload must be a list"""
+        res = self.client.post(BULK_URL, {"title": "x"}, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_BULK_MAX_ITEMS=2)
+    def test_bulk_limit(self):
+        """Test batches over the size limit are rejected"""
+        res = self.client.post(BULK_URL, self._payload(3), format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+
+@override_settings(
+    RECIPE_IMAGE_VARIANTS={"thumb": (20, 20), "medium": (50, 50)},
+    RECIPE_IMAGE_VARIANTS_EAGER=True,
+)
 class ImageUploadTests(TestCase):
     """Tests for image upload API"""
 
@@ -399,8 +1439,114 @@ class ImageUploadTests(TestCase):
 
     def tearDown(self):
         """Tests will leave image files on system if not deleted"""
+        self.recipe.refresh_from_db()
+        if self.recipe.image:
+            storage = self.recipe.image.storage
+            name = self.recipe.image.name
+            storage.delete(webp_name(name))
+            for variant in settings.RECIPE_IMAGE_VARIANTS:
+                storage.delete(variant_name(name, variant))
+                storage.delete(webp_name(variant_name(name, variant)))
         self.recipe.image.delete()
 
+    def _upload(self, size=(10, 10), img_format="JPEG", noise=False):
+        """Upload a generated image to the recipe"""
+        url = image_upload_url(self.recipe.id)
+        suffix = f".{img_format.lower()}"
+        with tempfile.NamedTemporaryFile(suffix=suffix) as image_file:
+            if noise:
+                data = os.urandom(size[0] * size[1] * 3)
+                img = Image.frombytes("RGB", size, data)
+            else:
+                img = Image.new("RGB", size)
+            img.save(image_file, format=img_format)
+            image_file.seek(0)
+            return self.client.post(
+                url, {"image": image_file}, format="multipart"
+            )
+
+    def test_upload_image_content_addressed(self):
+        """Test identical uploads are stored once under their hash"""
+        res = self._upload()
+        name = Recipe.objects.get(pk=self.recipe.pk).image.name
+        self.recipe = create_recipe(user=self.user)
+        res = self._upload()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, name)
+        with self.recipe.image.open() as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self.assertIn(digest, name)
+
+    def test_upload_image_generates_variants(self):
+        """Test resized variants are written and exposed on the recipe"""
+        res = self._upload(size=(200, 100))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        expected = {"thumb": (20, 10), "medium": (50, 25)}
+        for variant, size in expected.items():
+            self.assertIn(variant, self.recipe.image_variants)
+            path = self.recipe.image.storage.path(
+                variant_name(self.recipe.image.name, variant)
+            )
+            with Image.open(path) as img:
+                self.assertEqual(img.size, size)
+            with Image.open(webp_name(path)) as img:
+                self.assertEqual(img.format, "WEBP")
+                self.assertEqual(img.size, size)
+        self.assertTrue(os.path.exists(webp_name(self.recipe.image.path)))
+
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertIn("_thumb", res.data["image_variants"]["thumb"])
+
+    def test_variants_written_without_leftovers(self):
+        """Test variants are world readable and no temp file is left"""
+        self._upload(size=(200, 100))
+
+        self.recipe.refresh_from_db()
+        path = self.recipe.image.storage.path(
+            variant_name(self.recipe.image.name, "thumb")
+        )
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+        leftovers = [
+            name
+            for name in os.listdir(os.path.dirname(path))
+            if name.endswith(".tmp")
+        ]
+        self.assertEqual(leftovers, [])
+
+    @override_settings(RECIPE_IMAGE_VARIANTS_EAGER=False)
+    @patch("recipe.views.queue_recipe_variants")
+    def test_image_variants_fall_back_to_original(self, patched_queue):
+        """Test variant URLs point at the original until generated"""
+        res = self._upload()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        patched_queue.assert_called_once()
+        res = self.client.get(detail_url(self.recipe.id))
+        variants = res.data["image_variants"]
+        self.assertEqual(variants["thumb"], res.data["image"])
+        self.assertEqual(variants["medium"], res.data["image"])
+
+    @override_settings(RECIPE_IMAGE_VARIANTS_EAGER=False)
+    @patch("core.images.get_executor")
+    def test_variants_queued_on_commit(self, patched_executor):
+        """Test the resize job is only submitted once the upload commits"""
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self._upload()
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            patched_executor.assert_not_called()
+
+        patched_executor.return_value.submit.assert_called_once()
+
+    def test_recipe_without_image_has_no_variants(self):
+        """Test recipes without an image report no variants"""
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertIsNone(res.data["image_variants"])
+
     def test_upload_image(self):
         """Test uploading image to a recipe"""
         url = image_upload_url(self.recipe.id)
@@ -423,3 +1569,156 @@ class ImageUploadTests(TestCase):
         res = self.client.post(url, payload, format="multipart")
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_IMAGE_MAX_BYTES=1024)
+    def test_upload_image_too_large(self):
+        """Test uploads over the byte limit are refused"""
+        res = self._upload(size=(500, 500), noise=True)
+
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=99)
+    def test_upload_image_too_many_pixels(self):
+        """Test images over the pixel limit are rejected from the header"""
+        res = self._upload(size=(10, 10))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("image", res.data)
+
+    def test_upload_image_unsupported_format(self):
+        """Test images in formats that are not allowed are rejected"""
+        res = self._upload(img_format="BMP")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("image", res.data)
+
+    def test_upload_not_an_image(self):
+        """Test files that are not images are rejected"""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as image_file:
+            image_file.write(b"not an image")
+            image_file.seek(0)
+            res = self.client.post(
+                url, {"image": image_file}, format="multipart"
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ImageResizeTests(TestCase):
+    """Tests for the on-demand image resize API"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+        self.client = APIClient()
+        self.user = create_user(email="user@example.com")
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+        buffer = BytesIO()
+        Image.new("RGB", (200, 100)).save(buffer, format="JPEG")
+        self.recipe.image.save("photo.jpg", ContentFile(buffer.getvalue()))
+
+    def _get_image(self, params):
+        res = self.client.get(image_resize_url(self.recipe.id), params)
+        if res.status_code != status.HTTP_200_OK:
+            return res, None
+
+        with Image.open(BytesIO(b"".join(res.streaming_content))) as img:
+            return res, img.size
+
+    def test_resize_contain(self):
+        """Test images are fitted inside the requested box by default"""
+        res, size = self._get_image({"w": 40, "h": 40})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res["Content-Type"], "image/jpeg")
+        self.assertEqual(size, (40, 20))
+
+    def test_resize_single_side(self):
+        """Test a single side scales the image proportionally"""
+        _, size = self._get_image({"h": 50})
+
+        self.assertEqual(size, (100, 50))
+
+    def test_resize_cover(self):
+        """Test fit=cover fills the box and crops the overflow"""
+        _, size = self._get_image({"w": 40, "h": 40, "fit": "cover"})
+
+        self.assertEqual(size, (40, 40))
+
+    def test_resize_cache_hit_skips_pillow(self):
+        """Test repeated sizes are served from the disk cache"""
+        self._get_image({"w": 40, "h": 40})
+
+        with patch("core.images._resize") as patched_resize:
+            res, size = self._get_image({"w": 40, "h": 40})
+
+        patched_resize.assert_not_called()
+        self.assertEqual(size, (40, 20))
+
+    @override_settings(RECIPE_IMAGE_CACHE_MAX_BYTES=1)
+    def test_resize_cache_is_bounded(self):
+        """Test older entries are evicted once the cache is full"""
+        self._get_image({"w": 40})
+        self._get_image({"w": 50})
+
+        cached = [
+            name
+            for _, _, files in os.walk(resized_cache_dir())
+            for name in files
+        ]
+        self.assertEqual(len(cached), 1)
+
+    def test_resize_cache_miss_skips_scan_under_limit(self):
+        """Test misses only walk the cache once it may be full"""
+        self._get_image({"w": 40})
+
+        with patch("core.images.os.walk") as patched_walk:
+            res, size = self._get_image({"w": 50})
+
+        patched_walk.assert_not_called()
+        self.assertEqual(size, (50, 25))
+
+    def test_resize_evicted_entry_regenerated(self):
+        """Test an entry evicted since the last request is resized again"""
+        self._get_image({"w": 40})
+        for root, _, files in os.walk(resized_cache_dir()):
+            for name in files:
+                os.remove(os.path.join(root, name))
+
+        res, size = self._get_image({"w": 40})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(size, (40, 20))
+
+    def test_resize_invalid_params(self):
+        """Test bad sizes are rejected"""
+        for params in [{}, {"w": 0}, {"w": 40, "fit": "cover"}]:
+            res, _ = self._get_image(params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_resize_without_image(self):
+        """Test recipes without an image return 404"""
+        recipe = create_recipe(user=self.user)
+
+        res = self.client.get(image_resize_url(recipe.id), {"w": 40})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_resize_other_users_recipe(self):
+        """Test images of other users' recipes are not served"""
+        other = create_user(email="other@example.com")
+        self.client.force_authenticate(other)
+
+        res = self.client.get(image_resize_url(self.recipe.id), {"w": 40})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
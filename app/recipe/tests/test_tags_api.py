@@ -1,15 +1,19 @@
 """Tests for the tags API"""
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.urls import reverse
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 
 from core.models import Tag
 
 from recipe.serializers import TagSerializer
+from recipe.views import TagViewSet
 
 TAGS_URL = reverse("recipe:tag-list")
 
@@ -57,7 +61,7 @@ class PrivateTagsAPITests(TestCase):
         serializer = TagSerializer(tags, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_tags_limited_to_user(self):
         """Test tags list is limited to authenticated user"""
@@ -69,9 +73,78 @@ class PrivateTagsAPITests(TestCase):
         res = self.client.get(TAGS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]["name"], tag.name)
-        self.assertEqual(res.data[0]["id"], tag.id)
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertEqual(res.data["results"][0]["name"], tag.name)
+        self.assertEqual(res.data["results"][0]["id"], tag.id)
+
+    def test_tags_cursor_pagination_with_duplicate_names(self):
+        """Test paging through tags sharing a name skips none"""
+        tags = [
+            Tag.objects.create(user=self.user, name="Dinner") for _ in range(3)
+        ]
+        tags.append(Tag.objects.create(user=self.user, name="Brunch"))
+
+        seen = []
+        res = self.client.get(TAGS_URL, {"page_size": 1})
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            seen.extend(t["id"] for t in res.data["results"])
+            if not res.data["next"]:
+                break
+            res = self.client.get(res.data["next"])
+
+        expected = [t.id for t in reversed(tags[:3])] + [tags[3].id]
+        self.assertEqual(seen, expected)
+
+    def test_tags_cursor_pages_by_name_and_id(self):
+        """Test tied names page on both fields, forwards and back"""
+        tags = [
+            Tag.objects.create(user=self.user, name="Dinner") for _ in range(3)
+        ]
+        first = self.client.get(TAGS_URL, {"page_size": 1})
+        second = self.client.get(first.data["next"])
+
+        with CaptureQueriesContext(connection) as ctx:
+            third = self.client.get(second.data["next"])
+        back = self.client.get(third.data["previous"])
+
+        self.assertEqual(third.data["results"][0]["id"], tags[0].id)
+        self.assertEqual(back.data["results"], second.data["results"])
+        sql = next(
+            query["sql"]
+            for query in ctx.captured_queries
+            if 'FROM "core_tag"' in query["sql"]
+        )
+        self.assertIn('"core_tag"."id" <', sql)
+        self.assertNotIn("OFFSET", sql)
+
+    def test_tag_list_not_modified(self):
+        """Test the tag list answers a matching If-None-Match with 304"""
+        Tag.objects.create(user=self.user, name="Dinner")
+        etag = self.client.get(TAGS_URL)["ETag"]
+
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Tag.objects.create(user=self.user, name="Lunch")
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_tag_list_selects_rendered_columns(self):
+        """Test the tag list only fetches the columns it renders"""
+        Tag.objects.create(user=self.user, name="Dinner")
+        params = {"fields": "name"}
+        request = Request(APIRequestFactory().get(TAGS_URL, params))
+        request.user = self.user
+        view = TagViewSet(action="list", request=request, format_kwarg=None)
+
+        queryset = view.get_queryset()
+        res = self.client.get(TAGS_URL, params)
+
+        self.assertEqual(
+            queryset.query.deferred_loading, ({"id", "name"}, False)
+        )
+        self.assertEqual(res.data["results"], [{"name": "Dinner"}])
 
     def test_update_tag(self):
         """Test updating a tag"""
@@ -53,7 +53,7 @@ class PrivateIngredientsAPITests(TestCase):
         serializer = IngredientSerializer(ingredients, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_ingredients_limited_to_user(self):
         user2 = create_user(email="user2@example.com", password="password1231")
@@ -64,10 +64,20 @@ class PrivateIngredientsAPITests(TestCase):
         res = self.client.get(INGREDIENTS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data["results"]), 1)
 
-        self.assertEqual(res.data[0]["name"], ingredient.name)
-        self.assertEqual(res.data[0]["id"], ingredient.id)
+        self.assertEqual(res.data["results"][0]["name"], ingredient.name)
+        self.assertEqual(res.data["results"][0]["id"], ingredient.id)
+
+    def test_ingredient_list_cache_invalidated_on_rename(self):
+        """Test renaming an ingredient is visible on the next list"""
+        ingredient = Ingredient.objects.create(user=self.user, name="Eggs")
+        self.client.get(INGREDIENTS_URL)
+
+        self.client.patch(detail_url(ingredient.id), {"name": "Duck eggs"})
+        res = self.client.get(INGREDIENTS_URL)
+
+        self.assertEqual(res.json()["results"][0]["name"], "Duck eggs")
 
     def test_update_ingredient(self):
         """Test updating and ingredient"""
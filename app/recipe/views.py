@@ -1,36 +1,277 @@
 """Views for the recipe API"""
 
+import mimetypes
+
+from django.contrib.postgres.search import (
+    SearchHeadline,
+    SearchQuery,
+    SearchRank,
+)
+from django.conf import settings
+from django.db.models import (
+    Count,
+    Exists,
+    F,
+    FloatField,
+    OuterRef,
+    Prefetch,
+    prefetch_related_objects,
+)
+from django.db import transaction
+from django.db.models.functions import Cast
+from django.http import FileResponse, Http404, StreamingHttpResponse
+
+from drf_spectacular.utils import (
+    extend_schema,
+    extend_schema_view,
+    OpenApiParameter,
+    OpenApiTypes,
+)
+
 from rest_framework import viewsets, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
+from core.authentication import (
+    CachedTokenAuthentication,
+    SignedTokenAuthentication,
+)
+from core.images import get_resized, queue_recipe_variants
 from core.models import Recipe, Tag, Ingredient
+from core.signals import batched_deletes
+from core.uploadhandlers import LimitedImageUploadHandler
 from recipe import serializers
+from recipe.mixins import (
+    ConditionalRequestMixin,
+    ResponseCacheMixin,
+    SparseFieldsMixin,
+    SQLJSONListMixin,
+    ValuesReadMixin,
+)
+from recipe.pagination import (
+    RecipeAttrCursorPagination,
+    RecipeCursorPagination,
+)
+from recipe.renderers import CSVRenderer, NDJSONRenderer
+
+
+SPARSE_FIELDS_PARAMETERS = [
+    OpenApiParameter(
+        "fields",
+        OpenApiTypes.STR,
+        description="Comma separated list of the fields to return",
+    ),
+    OpenApiParameter(
+        "expand",
+        OpenApiTypes.STR,
+        description=(
+            "Comma separated list of the nested relations to return, "
+            "tags and/or ingredients"
+        ),
+    ),
+]
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+@extend_schema_view(
+    list=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "tags",
+                OpenApiTypes.STR,
+                description="Comma separated list of tag IDs to filter",
+            ),
+            OpenApiParameter(
+                "ingredients",
+                OpenApiTypes.STR,
+                description="Comma separated list of ingredient IDs to filter",
+            ),
+            OpenApiParameter(
+                "match",
+                OpenApiTypes.STR,
+                enum=["any", "all"],
+                description=(
+                    "Return recipes linked to any (default) or all of the "
+                    "given IDs"
+                ),
+            ),
+            OpenApiParameter(
+                "search",
+                OpenApiTypes.STR,
+                description=(
+                    "Full-text search over title and description, "
+                    "results are ordered by relevance"
+                ),
+            ),
+            OpenApiParameter(
+                "highlight",
+                OpenApiTypes.BOOL,
+                description="Include a highlighted snippet in search results",
+            ),
+            *SPARSE_FIELDS_PARAMETERS,
+        ]
+    ),
+    retrieve=extend_schema(parameters=SPARSE_FIELDS_PARAMETERS),
+)
+class RecipeViewSet(
+    ConditionalRequestMixin,
+    ResponseCacheMixin,
+    SQLJSONListMixin,
+    ValuesReadMixin,
+    SparseFieldsMixin,
+    viewsets.ModelViewSet,
+):
     """View for managing recipes"""
 
     serializer_class = serializers.RecipeDetailSerializer
+    field_columns = {
+        "image_variants": ["image", "image_variants"],
+        # annotated by the search
+        "snippet": [],
+    }
+    # ordered like the rows read by ValuesReadMixin
+    expandable = {
+        "tags": Prefetch("tags", queryset=Tag.objects.order_by("id")),
+        "ingredients": Prefetch(
+            "ingredients", queryset=Ingredient.objects.order_by("id")
+        ),
+    }
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication,
+        SignedTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeCursorPagination
+
+    @property
+    def search_query(self):
+        """Return the full-text query for the request, if any"""
+        search = self.request.query_params.get("search", "").strip()
+        if not search:
+            return None
+
+        return SearchQuery(search, config="english", search_type="websearch")
+
+    @property
+    def highlight(self):
+        """Whether search results should include a snippet"""
+        value = self.request.query_params.get("highlight", "")
+        return self.search_query is not None and value.lower() in (
+            "1",
+            "true",
+        )
+
+    @property
+    def pagination_ordering(self):
+        """Page search results by relevance, everything else by id"""
+        if self.action == "list" and self.search_query is not None:
+            return ("-rank", "-id")
+
+        return None
 
     def get_serializer_class(self):
         """Return the serializer class for request"""
-        if self.action == "list":
+        if self.action == "list" and self.highlight:
+            return serializers.RecipeSearchSerializer
+        elif self.action == "list":
             return serializers.RecipeSerializer
         # this is custom action
         elif self.action == "upload_image":
             return serializers.RecipeImageSerializer
+        elif self.action == "export":
+            return serializers.RecipeDetailSerializer
 
         return self.serializer_class
 
+    def _params_to_ints(self, param):
+        """Convert a comma separated query param to a list of integers"""
+        value = self.request.query_params.get(param)
+        if not value:
+            return []
+
+        try:
+            return [int(str_id) for str_id in value.split(",") if str_id]
+        except ValueError:
+            raise ValidationError(
+                {param: "Expected a comma separated list of IDs."}
+            )
+
+    def _filter_related(self, queryset, related_name, ids, match_all):
+        """
+        Filter recipes by linked ids with an EXISTS subquery on the
+        through table, so matches never duplicate rows or need DISTINCT.
+        """
+        field = getattr(Recipe, related_name).field
+        target = f"{field.m2m_reverse_field_name()}_id"
+        links = field.remote_field.through.objects.filter(
+            recipe_id=OuterRef("pk"), **{f"{target}__in": ids}
+        )
+        if match_all:
+            links = (
+                links.values("recipe_id")
+                .annotate(matched=Count("*"))
+                .filter(matched=len(set(ids)))
+            )
+
+        return queryset.filter(Exists(links))
+
+    def _filter_by_ids(self, queryset):
+        """Apply the tags, ingredients and match query params"""
+        tag_ids = self._params_to_ints("tags")
+        ingredient_ids = self._params_to_ints("ingredients")
+        match = self.request.query_params.get("match", "any")
+        if match not in ("any", "all"):
+            raise ValidationError({"match": "Expected 'any' or 'all'."})
+
+        if tag_ids:
+            queryset = self._filter_related(
+                queryset, "tags", tag_ids, match == "all"
+            )
+        if ingredient_ids:
+            queryset = self._filter_related(
+                queryset, "ingredients", ingredient_ids, match == "all"
+            )
+
+        return queryset
+
     def get_queryset(self):
         """Retrieve recipes only for authenticated user"""
-        return self.queryset.filter(user=self.request.user).order_by("-id")
+        queryset = self.queryset.filter(user=self.request.user)
+        if self.action in ("list", "export"):
+            queryset = self._filter_by_ids(queryset)
+
+        queryset = queryset.defer("search_vector").prefetch_related(
+            "tags", "ingredients"
+        )
+        queryset = self.narrow_queryset(queryset)
+
+        query = self.search_query
+        if self.action == "list" and query is not None:
+            return self._search(queryset, query)
+
+        return queryset.order_by("-id")
+
+    def _search(self, queryset, query):
+        """Match and rank recipes against a full-text query"""
+        # cast to double so cursor positions round-trip exactly
+        queryset = queryset.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+        )
+        if self.highlight:
+            queryset = queryset.annotate(
+                snippet=SearchHeadline(
+                    "description",
+                    query,
+                    config="english",
+                    start_sel="<mark>",
+                    stop_sel="</mark>",
+                    max_fragments=2,
+                )
+            )
+
+        return queryset.order_by("-rank", "-id")
 
     def perform_create(self, serializer):
         """Create a new recipe"""
@@ -40,24 +281,224 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def upload_image(self, request, pk=None):
         """Upload an image"""
         recipe = self.get_object()
+        # must be set before request.data is first read
+        request.upload_handlers = [LimitedImageUploadHandler(request)]
         serializer = self.get_serializer(recipe, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            recipe = serializer.save(image_variants={})
+            queue_recipe_variants(recipe)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("w", OpenApiTypes.INT, description="Width"),
+            OpenApiParameter("h", OpenApiTypes.INT, description="Height"),
+            OpenApiParameter(
+                "fit",
+                OpenApiTypes.STR,
+                enum=["contain", "cover"],
+                description=(
+                    "Fit inside the box (default) or fill it and crop the "
+                    "overflow"
+                ),
+            ),
+        ],
+        responses={(200, "image/*"): OpenApiTypes.BINARY},
+    )
+    @action(methods=["GET"], detail=True, url_path="image")
+    def image(self, request, pk=None):
+        """Return the recipe image resized to the requested size"""
+        params = serializers.RecipeImageResizeSerializer(
+            data=request.query_params
+        )
+        params.is_valid(raise_exception=True)
+        recipe = self.get_object()
+        if not recipe.image:
+            raise Http404
+
+        file = get_resized(
+            recipe.image.path, recipe.image.name, **params.validated_data
+        )
+        content_type, _ = mimetypes.guess_type(file.name)
+        return FileResponse(file, content_type=content_type)
+
+    def _iter_export(self, queryset, chunk_size):
+        """
+        Yield serialized recipes read through a server-side cursor, one
+        chunk at a time with its tags and ingredients prefetched, so
+        memory use does not grow with the size of the collection.
+        """
+        chunk = []
+        for recipe in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(recipe)
+            if len(chunk) == chunk_size:
+                yield from self._serialize_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield from self._serialize_chunk(chunk)
+
+    def _serialize_chunk(self, chunk):
+        prefetch_related_objects(chunk, "tags", "ingredients")
+        return self.get_serializer(chunk, many=True).data
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "format",
+                OpenApiTypes.STR,
+                enum=["ndjson", "csv"],
+                description="Export format, ndjson by default",
+            ),
+        ],
+        responses={
+            (200, "application/x-ndjson"): OpenApiTypes.STR,
+            (200, "text/csv"): OpenApiTypes.STR,
+        },
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        renderer_classes=[NDJSONRenderer, CSVRenderer],
+    )
+    def export(self, request):
+        """Stream every recipe of the user as NDJSON or CSV"""
+        # iterator() ignores prefetch_related, chunks are prefetched instead
+        queryset = self.get_queryset().prefetch_related(None).order_by("id")
+        rows = self._iter_export(queryset, settings.RECIPE_EXPORT_CHUNK_SIZE)
+
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.iter_rows(rows),
+            content_type=f"{renderer.media_type}; charset={renderer.charset}",
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="recipes.{renderer.format}"'
+        )
+        return response
+
+    def _get_bulk_instances(self, ids):
+        """
+        Return the user's recipes for a list of ids, locked for update,
+        with an error for each id that is not an integer, not one of them
+        or repeats one.
+        """
+        # anything else, lists and dicts included, is not a usable key
+        valid = [
+            isinstance(pk, int) and not isinstance(pk, bool) for pk in ids
+        ]
+        recipes = (
+            Recipe.objects.filter(
+                user=self.request.user,
+                pk__in=[pk for pk, ok in zip(ids, valid) if ok],
+            )
+            .select_for_update()
+            .defer("search_vector")
+            .in_bulk()
+        )
+        errors = []
+        seen = set()
+        for pk, ok in zip(ids, valid):
+            if not ok:
+                errors.append({"id": ["A valid integer is required."]})
+            elif pk not in recipes:
+                errors.append({"id": ["Not found."]})
+            elif pk in seen:
+                errors.append({"id": ["Duplicate id."]})
+            else:
+                errors.append({})
+                seen.add(pk)
+        return recipes, errors
+
+    def _bulk_create(self, data):
+        serializer = self.get_serializer(data=data, many=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(user=self.request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def _bulk_update(self, data):
+        ids = [
+            item.get("id") if isinstance(item, dict) else None
+            for item in data
+        ]
+        recipes, errors = self._get_bulk_instances(ids)
+        if any(errors):
+            raise ValidationError(errors)
+
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in ids], data=data, many=True, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
+    def _bulk_destroy(self, data):
+        recipes, errors = self._get_bulk_instances(data)
+        if any(errors):
+            raise ValidationError(errors)
+
+        # one version bump and one decref per image for the whole batch
+        with batched_deletes():
+            Recipe.objects.filter(pk__in=list(recipes)).delete()
+        return Response([{"id": pk, "deleted": True} for pk in recipes])
+
+    @extend_schema(
+        request=serializers.RecipeDetailSerializer(many=True),
+        responses=serializers.RecipeDetailSerializer(many=True),
+        description=(
+            "POST a list of recipes to create them, PATCH a list of partial "
+            "recipes with their ids to update them or DELETE a list of ids. "
+            "The batch is applied in one transaction, if any item is "
+            "invalid nothing is written and the errors are returned in the "
+            "order of the items."
+        ),
+    )
+    @action(methods=["POST", "PATCH", "DELETE"], detail=False)
+    def bulk(self, request):
+        """Create, update or delete many recipes at once"""
+        data = request.data
+        if not isinstance(data, list):
+            raise ValidationError({"detail": ["Expected a list of items."]})
+        if len(data) > settings.RECIPE_BULK_MAX_ITEMS:
+            raise ValidationError(
+                {
+                    "detail": [
+                        "Expected at most "
+                        f"{settings.RECIPE_BULK_MAX_ITEMS} items."
+                    ]
+                }
+            )
+
+        handler = {
+            "POST": self._bulk_create,
+            "PATCH": self._bulk_update,
+            "DELETE": self._bulk_destroy,
+        }[request.method]
+        with transaction.atomic():
+            return handler(data)
+
 
-class BaseRecipeAttrViewSet(viewsets.ModelViewSet):
+class BaseRecipeAttrViewSet(
+    ConditionalRequestMixin,
+    ResponseCacheMixin,
+    SparseFieldsMixin,
+    viewsets.ModelViewSet,
+):
     """Base class for recipe attributes"""
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication,
+        SignedTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeAttrCursorPagination
 
     def get_queryset(self):
         """Filter tags to the authenticated user"""
-        return self.queryset.filter(user=self.request.user).order_by("-name")
+        queryset = self.queryset.filter(user=self.request.user)
+        return self.narrow_queryset(queryset).order_by("-name")
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
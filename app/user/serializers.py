@@ -1,9 +1,12 @@
 """Serializers for the users API View"""
 
 from django.contrib.auth import get_user_model, authenticate
+from django.core import signing
 
 from rest_framework import serializers
 
+from core.tokens import user_from_refresh_token
+
 
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for the user object"""
@@ -55,3 +58,20 @@ class AuthTokenSerializer(serializers.Serializer):
 
         attrs["user"] = user
         return attrs
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    """Serializer for exchanging a refresh token"""
+
+    refresh = serializers.CharField(trim_whitespace=False)
+
+    def validate(self, attrs):
+        """Validate the refresh token and resolve its user"""
+        try:
+            user = user_from_refresh_token(attrs["refresh"])
+        except signing.BadSignature:
+            msg = "Invalid or expired refresh token"
+            raise serializers.ValidationError(msg, code="authorization")
+
+        attrs["user"] = user
+        return attrs
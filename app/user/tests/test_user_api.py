@@ -9,6 +9,7 @@ from rest_framework import status
 
 CREATE_USER_URL = reverse("user:create")
 TOKEN_URL = reverse("user:token")
+TOKEN_REFRESH_URL = reverse("user:token-refresh")
 ME_URL = reverse("user:me")
 
 
@@ -90,6 +91,51 @@ class PublicUserAPITests(TestCase):
         self.assertIn("token", res.data)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
+    def test_create_token_returns_signed_tokens(self):
+        """Test the token endpoint also issues access and refresh tokens"""
+        create_user(email="test@example.com", password="testpass123")
+        payload = {"email": "test@example.com", "password": "testpass123"}
+
+        res = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn("access", res.data)
+        self.assertIn("refresh", res.data)
+
+        access = res.data["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["email"], "test@example.com")
+
+    def test_refresh_token(self):
+        """Test exchanging a refresh token for a new access token"""
+        create_user(email="test@example.com", password="testpass123")
+        payload = {"email": "test@example.com", "password": "testpass123"}
+        tokens = self.client.post(TOKEN_URL, payload).data
+
+        res = self.client.post(
+            TOKEN_REFRESH_URL, {"refresh": tokens["refresh"]}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn("access", res.data)
+        self.assertIn("refresh", res.data)
+
+    def test_refresh_token_revoked_by_password_change(self):
+        """Test refresh tokens stop working once the password changes"""
+        user = create_user(email="test@example.com", password="testpass123")
+        payload = {"email": "test@example.com", "password": "testpass123"}
+        tokens = self.client.post(TOKEN_URL, payload).data
+
+        user.set_password("newpass123")
+        user.save()
+        res = self.client.post(
+            TOKEN_REFRESH_URL, {"refresh": tokens["refresh"]}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_create_token_bad_credentials(self):
         """Test returns error is credentials invalide"""
         user_details = {